@@ -0,0 +1,315 @@
+"""Replay a message stream through AutoTranslate against a local DeepL stand-in.
+
+Nothing here talks to Discord or spends DeepL quota. A small aiohttp server
+answers /v2/translate and /v2/usage with configurable latency, errors and
+429s, and stub channels record when each translated post is delivered.
+
+Run from the repository root:
+
+    python benchmarks/autotranslate_replay.py --messages 500 --rate 20
+    python benchmarks/autotranslate_replay.py --replay stream.jsonl
+
+A replay file holds one JSON object per line with "content" and optionally
+"author" and "delay" (seconds to wait before sending that message).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(REPO_ROOT)
+
+GUILD_ID = 383365467894710272
+SOURCE_CHANNEL_ID = 1
+SAMPLE_PHRASES = [
+    "Good morning everyone!",
+    "Rally on the gas field in five minutes.",
+    "Who is leading the flag capture tonight?",
+    "Thanks for the help with the mill.",
+    "Please reinforce lane two, they are pushing hard.",
+    "ok",
+    "lol",
+    "See the plan here https://example.com/plan and ping <@1234> if unsure.",
+    "😀😀😀",
+    "We need more steel before the event starts. Can anyone trade?",
+]
+
+
+class FakeDeepL:
+  """Minimal DeepL API stand-in with injectable latency and failures."""
+
+  def __init__(self, latency_ms, jitter_ms, error_rate, throttle_rate):
+    self.latency_ms = latency_ms
+    self.jitter_ms = jitter_ms
+    self.error_rate = error_rate
+    self.throttle_rate = throttle_rate
+    self.requests = 0
+    self.texts = 0
+    self.characters = 0
+    self.errors = 0
+    self.throttled = 0
+
+  async def translate(self, request):
+    self.requests += 1
+    delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+    await asyncio.sleep(max(0.0, delay) / 1000)
+    roll = random.random()
+    if roll < self.throttle_rate:
+      self.throttled += 1
+      return web.json_response({"message": "Too many requests"}, status=429)
+    if roll < self.throttle_rate + self.error_rate:
+      self.errors += 1
+      return web.json_response({"message": "Internal error"}, status=500)
+
+    body = await request.json()
+    texts = body["text"]
+    self.texts += len(texts)
+    self.characters += sum(len(text) for text in texts)
+    target = body["target_lang"]
+    return web.json_response({
+        "translations": [{
+            "detected_source_language": "EN",
+            "text": f"[{target}] {text}"
+        } for text in texts]
+    })
+
+  async def usage(self, _request):
+    return web.json_response({
+        "character_count": self.characters,
+        "character_limit": 500000
+    })
+
+  async def start(self):
+    app = web.Application()
+    app.router.add_post("/v2/translate", self.translate)
+    app.router.add_route("*", "/v2/usage", self.usage)
+    self.runner = web.AppRunner(app)
+    await self.runner.setup()
+    site = web.TCPSite(self.runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+  async def stop(self):
+    await self.runner.cleanup()
+
+
+class StubAvatar:
+  url = "https://cdn.example.com/avatar.png"
+
+
+class StubAuthor:
+
+  def __init__(self, name):
+    self.display_name = name
+    self.display_avatar = StubAvatar()
+    self.bot = False
+
+
+class StubObject:
+
+  def __init__(self, object_id):
+    self.id = object_id
+
+
+class StubMessage:
+
+  def __init__(self, message_id, content, author):
+    self.id = message_id
+    self.content = content
+    self.author = author
+    self.webhook_id = None
+    self.guild = StubObject(GUILD_ID)
+    self.channel = StubObject(SOURCE_CHANNEL_ID)
+    self.created_at = None
+
+
+class StubWebhook:
+  name = "AutoTranslate"
+  user = "benchmark"
+
+  def __init__(self, latency_ms):
+    self.latency_ms = latency_ms
+    self.next_id = 10**12
+
+  async def send(self, **_kwargs):
+    await asyncio.sleep(self.latency_ms / 1000)
+    self.next_id += 1
+    return StubObject(self.next_id)
+
+
+class StubChannel:
+
+  def __init__(self, channel_id, latency_ms):
+    self.id = channel_id
+    self.webhook = StubWebhook(latency_ms)
+
+  async def webhooks(self):
+    return [self.webhook]
+
+
+class StubClient:
+  user = "benchmark"
+
+  def __init__(self, channels):
+    self.channels = {channel.id: channel for channel in channels}
+
+  def get_channel(self, channel_id):
+    return self.channels.get(channel_id)
+
+
+def synthetic_stream(count, rate):
+  authors = [f"Member{index}" for index in range(12)]
+  for _ in range(count):
+    yield {
+        "content": random.choice(SAMPLE_PHRASES),
+        "author": random.choice(authors),
+        "delay": random.expovariate(rate) if rate > 0 else 0
+    }
+
+
+def replay_stream(path):
+  with open(path, 'r', encoding='utf-8') as replay_file:
+    for line in replay_file:
+      if line.strip():
+        yield json.loads(line)
+
+
+def percentile(values, fraction):
+  ordered = sorted(values)
+  index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+  return ordered[index]
+
+
+async def run(args):
+  random.seed(args.seed)
+  fake = FakeDeepL(args.latency_ms, args.jitter_ms, args.error_rate,
+                   args.throttle_rate)
+  server_url = await fake.start()
+  workdir = tempfile.mkdtemp(prefix="autotranslate-bench-")
+  os.environ["DEEPLKEY"] = "benchmark:fx"
+
+  # Build the shared service by hand so caches and state land in workdir
+  from cogs.utils import translation
+  from cogs.utils.message_map import TranslatedMessageMap
+  from cogs.utils.quota import QuotaGovernor
+  from cogs.utils.translation_cache import TranslationCache
+  translation._service = translation.TranslationService(
+      "benchmark:fx",
+      server_url=server_url,
+      cache=TranslationCache(path=os.path.join(workdir, "cache.sqlite3")),
+      quota=QuotaGovernor(path=os.path.join(workdir, "quota.json")))
+  from cogs.AutoTranslate import AutoTranslate
+
+  languages = args.languages.split(",")
+  targets = [
+      StubChannel(100 + index, args.discord_latency_ms)
+      for index in range(args.targets)
+  ]
+  cog = AutoTranslate(StubClient(targets))
+  cog.message_map = TranslatedMessageMap(path=os.path.join(
+      workdir, "messages.json"))
+  cog.translation_mapping = {
+      "benchmark": {
+          "source_channel":
+          str(SOURCE_CHANNEL_ID),
+          "target_channels":
+          [(str(channel.id), languages[index % len(languages)])
+           for index, channel in enumerate(targets)]
+      }
+  }
+  cog.rebuild_routes()
+
+  sent_at = {}
+  latencies = []
+  remember_post = cog.delivery.on_posted
+
+  def on_posted(channel, message_id, via_webhook, batch, continued):
+    now = time.perf_counter()
+    for item in batch:
+      latencies.append(now - sent_at[item.source_id])
+    remember_post(channel, message_id, via_webhook, batch, continued)
+
+  cog.delivery.on_posted = on_posted
+
+  stream = (replay_stream(args.replay)
+            if args.replay else synthetic_stream(args.messages, args.rate))
+  handlers = []
+  started = time.perf_counter()
+  for message_id, entry in enumerate(stream, start=1):
+    if entry.get("delay"):
+      await asyncio.sleep(entry["delay"])
+    message = StubMessage(message_id, entry["content"],
+                          StubAuthor(entry.get("author", "Member")))
+    sent_at[message_id] = time.perf_counter()
+    handlers.append(asyncio.create_task(cog.on_message(message)))
+  await asyncio.gather(*handlers)
+
+  expected = len(sent_at) * len(targets)
+  deadline = time.perf_counter() + args.drain_timeout
+  while len(latencies) < expected and time.perf_counter() < deadline:
+    await asyncio.sleep(0.05)
+  elapsed = time.perf_counter() - started
+
+  cog.delivery.close()
+  await fake.stop()
+  translation._service.cache.close()
+
+  messages = len(sent_at)
+  print(f"messages replayed      {messages}")
+  print(f"targets per message    {len(targets)} ({args.languages})")
+  print(f"wall time              {elapsed:.2f} s")
+  print(f"throughput             {messages / elapsed:.1f} messages/s")
+  print(f"deliveries             {len(latencies)} of {expected}")
+  if latencies:
+    print("delivery latency       "
+          f"p50 {percentile(latencies, 0.5) * 1000:.0f} ms  "
+          f"p90 {percentile(latencies, 0.9) * 1000:.0f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:.0f} ms  "
+          f"mean {statistics.mean(latencies) * 1000:.0f} ms")
+  print(f"DeepL requests         {fake.requests} "
+        f"({fake.requests / max(messages, 1):.2f} per message, "
+        f"{fake.throttled} throttled, {fake.errors} errors)")
+  print(f"characters translated  {fake.characters} "
+        f"({fake.characters / max(messages, 1):.1f} per message)")
+  cache_stats = translation._service.cache.stats()
+  print(f"cache hit rate         {cache_stats['hit_rate']:.0%}")
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--messages", type=int, default=300,
+                      help="synthetic messages to generate")
+  parser.add_argument("--rate", type=float, default=20,
+                      help="average synthetic messages per second")
+  parser.add_argument("--replay", help="JSONL message stream to replay")
+  parser.add_argument("--targets", type=int, default=5,
+                      help="target channels bridged from the source")
+  parser.add_argument("--languages", default="DE,FR,ES",
+                      help="comma separated languages spread over targets")
+  parser.add_argument("--latency-ms", type=float, default=150,
+                      help="fake DeepL response latency")
+  parser.add_argument("--jitter-ms", type=float, default=50)
+  parser.add_argument("--error-rate", type=float, default=0.0,
+                      help="share of DeepL requests answered with a 500")
+  parser.add_argument("--throttle-rate", type=float, default=0.0,
+                      help="share of DeepL requests answered with a 429")
+  parser.add_argument("--discord-latency-ms", type=float, default=100,
+                      help="simulated webhook send latency")
+  parser.add_argument("--drain-timeout", type=float, default=60,
+                      help="seconds to wait for queued deliveries")
+  parser.add_argument("--seed", type=int, default=0)
+  asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+  main()
@@ -1,12 +1,16 @@
+import asyncio
 import json
-import os
 import uuid
 
-import deepl
 import discord
 from discord import app_commands
 from discord.ext import commands
 
+from cogs.utils.message_map import TranslatedMessageMap, content_digest
+from cogs.utils.storage import open_storage
+from cogs.utils.translation import get_translation_service
+from cogs.utils.webhook_delivery import DeliveryItem, WebhookDelivery
+
 
 class TranslationJobRemovalSelect(discord.ui.Select):
 
@@ -43,10 +47,11 @@ class TranslationJobRemovalSelect(discord.ui.Select):
           self.client.get_channel(int(target[0])).name
           for target in job_details["target_channels"]
       ])
+      cog = interaction.client.get_cog('AutoTranslate')
+      if cog:
+        cog.rebuild_routes()
+        await cog.storage.translation_jobs.remove(job_id)
       if source_channel:
-        cog = interaction.client.get_cog('AutoTranslate')
-        if cog:
-          cog.save_translation_jobs()
         await interaction.response.send_message(
             f"Removed translation job: From {source_channel.name} to {target_channels_info}.",
             ephemeral=True)
@@ -69,14 +74,29 @@ class AutoTranslate(commands.Cog):
 
   def __init__(self, client: commands.Bot):
     self.client = client
-    deepl_key = os.getenv("DEEPLKEY")
-    if deepl_key is None:
-      raise ValueError("DEEPLKEY environment variable is not set")
-    self.translator = deepl.Translator(deepl_key)
+    self.translator = get_translation_service()
     self.language_dict = self.load_language_dict()
-    self.translation_mapping = self.load_translation_jobs()
+    self.storage = None
+    self.translation_mapping = {}
+    # source channel id -> [(target channel id, language code, job id,
+    #                        priority), ...]
+    self.routes = {}
     self.allowed_guild_ids = {1045479020940234783,
                               383365467894710272}  # Add your guild IDs here
+    # Caps how many DeepL calls are in flight across all bridges at once
+    self.translation_semaphore = asyncio.Semaphore(4)
+    self.delivery = WebhookDelivery(client)
+    self.message_map = TranslatedMessageMap()
+    self.delivery.on_posted = self.remember_post
+
+  async def cog_load(self):
+    self.storage = await open_storage()
+    self.translation_mapping = await self.storage.translation_jobs.load_all()
+    self.rebuild_routes()
+
+  async def cog_unload(self):
+    self.delivery.close()
+    self.message_map.save()
 
   def guild_check(self, interaction: discord.Interaction):
     return interaction.guild_id and interaction.guild_id in self.allowed_guild_ids
@@ -89,64 +109,187 @@ class AutoTranslate(commands.Cog):
       print(f"Failed to load language dictionary: {e}")
       return {}
 
-  def load_translation_jobs(self):
-    translate_jobs_path = 'cogs/cogfiles/TranslateJobs.json'
-    if not os.path.exists(translate_jobs_path):
-      with open(translate_jobs_path, 'w') as jobs_file:
-        json.dump({}, jobs_file)
-      print(
-          "TranslateJobs.json did not exist and was created with an empty dictionary."
-      )
-      return {}
+  def rebuild_routes(self):
+    routes = {}
+    for job_id, job_details in self.translation_mapping.items():
+      targets = routes.setdefault(int(job_details["source_channel"]), [])
+      priority = job_details.get("priority", "normal")
+      for target_channel_id, target_language_code in job_details[
+          "target_channels"]:
+        targets.append(
+            (int(target_channel_id), target_language_code, job_id, priority))
+    self.routes = routes
 
-    try:
-      with open(translate_jobs_path, 'r') as jobs_file:
-        return json.load(jobs_file)
-    except json.JSONDecodeError:
-      with open(translate_jobs_path, 'w') as jobs_file:
-        json.dump({}, jobs_file)
-      print(
-          "TranslateJobs.json contains invalid JSON. Initializing with an empty dictionary."
-      )
-      return {}
-    except Exception as e:
-      print(f"Failed to load translation jobs: {e}")
-      return {}
+  @commands.Cog.listener()
+  async def on_message(self, message):
+    if message.author.bot or message.webhook_id or not message.guild or message.guild.id not in self.allowed_guild_ids:
+      return
+
+    targets = self.routes.get(message.channel.id)
+    if not targets:
+      return
+
+    if not message.content.strip():
+      # Nothing to translate (an image, a sticker...); attachments are
+      # still passed on as links so the other side sees them
+      if message.attachments:
+        self.forward_attachments(message, targets)
+      return
+
+    # Group targets by language so each language is translated only once.
+    # Bridges the quota governor refuses are left out of this message.
+    targets_by_language = {}
+    for target_channel_id, target_language_code, job_id, priority in targets:
+      allowed, _ = self.translator.quota.allow(message.content, job_id,
+                                               priority)
+      if not allowed:
+        continue
+      target_channel = self.client.get_channel(target_channel_id)
+      if target_channel:
+        group = targets_by_language.setdefault(target_language_code,
+                                               (job_id, []))
+        group[1].append(target_channel)
+    if not targets_by_language:
+      return
+
+    await asyncio.gather(
+        *(self.translate_and_post(message, language, job_id, channels)
+          for language, (job_id, channels) in targets_by_language.items()))
+
+  def forward_attachments(self, message, targets):
+    note = "\n".join(attachment.url for attachment in message.attachments)
+    for target_channel_id, target_language_code, _, _ in targets:
+      channel = self.client.get_channel(target_channel_id)
+      if channel:
+        self.delivery.enqueue(
+            channel,
+            DeliveryItem(message.author.display_name,
+                         message.author.display_avatar.url,
+                         note,
+                         target_language_code,
+                         source_id=message.id,
+                         source_digest=content_digest(message.content)))
 
-  def save_translation_jobs(self):
+  async def translate_and_post(self, message, target_language_code, job_id,
+                               target_channels):
+    # Characters are billed once per language, so they are accounted to the
+    # first bridge that asked for it
     try:
-      with open('cogs/cogfiles/TranslateJobs.json', 'w') as jobs_file:
-        json.dump(self.translation_mapping, jobs_file, indent=4)
+      async with self.translation_semaphore:
+        result = await self.translator.translate_message(
+            message.content,
+            target_language_code,
+            guild_id=message.guild.id,
+            bridge_id=job_id)
     except Exception as e:
-      print(f"Failed to save translation jobs: {e}")
+      print(f"Error during translation: {e}")
+      return
+
+    for channel in target_channels:
+      self.delivery.enqueue(
+          channel,
+          DeliveryItem(message.author.display_name,
+                       message.author.display_avatar.url,
+                       result.text,
+                       target_language_code,
+                       source_id=message.id,
+                       source_digest=content_digest(message.content)))
+
+  def remember_post(self, channel, message_id, via_webhook, batch,
+                    continued):
+    parts = [[
+        item.source_id, item.author_name, item.avatar_url, item.text,
+        item.source_digest
+    ] for item in batch]
+    self.message_map.add_post(channel.id, message_id, batch[0].language,
+                              via_webhook, parts, continued)
+
+  def delivery_items(self, post):
+    return [
+        DeliveryItem(author_name, avatar_url, text, post["language"],
+                     source_id)
+        for source_id, author_name, avatar_url, text, *_ in post["parts"]
+    ]
+
+  def route_for(self, source_channel_id, target_channel_id):
+    """(job id, priority) of the bridge between two channels, or None."""
+    for target_id, _, job_id, priority in self.routes.get(
+        source_channel_id, ()):
+      if target_id == target_channel_id:
+        return job_id, priority
+    return None
 
   @commands.Cog.listener()
-  async def on_message(self, message):
-    if message.author.bot or not message.guild or message.guild.id not in self.allowed_guild_ids:
+  async def on_raw_message_edit(self, payload):
+    if "content" not in payload.data:
+      return
+    posts = self.message_map.posts_for(payload.message_id)
+    if not posts:
       return
 
-    for job_id, job_details in self.translation_mapping.items():
-      source_channel_id = job_details["source_channel"]
-      if str(message.channel.id) == source_channel_id:
-        for target_channel_id, target_language_code in job_details[
-            "target_channels"]:
-          target_channel = self.client.get_channel(int(target_channel_id))
-          if target_channel:
-            try:
-              result = self.translator.translate_text(
-                  text=message.content, target_lang=target_language_code)
-              translated_text = result.text
-              embed = discord.Embed(
-                  title=f"Message from {message.author.display_name}",
-                  description=translated_text,
-                  color=0x3498db)
-              # Optionally, you can add footer, timestamp or any other info to embed.
-              embed.set_footer(text=f"Translated to {target_language_code}")
-              embed.timestamp = message.created_at
-              # Send embed
-              await target_channel.send(embed=embed)
-            except Exception as e:
-              print(f"Error during translation: {e}")
+    content = payload.data["content"]
+    if not content.strip():
+      return
+    digest = content_digest(content)
+    # Edits are translated sentence by sentence; the first translation
+    # cached every sentence, so only the changed ones cost a call
+    translations = {}
+    for post_id, post in posts:
+      if self.message_map.source_digest(post_id, payload.message_id) == digest:
+        continue  # e.g. a link preview was added; the text did not change
+      language = post["language"]
+      if language not in translations:
+        route = self.route_for(payload.channel_id, post["channel_id"])
+        if route is None:
+          continue  # the bridge was removed since the post was made
+        job_id, priority = route
+        allowed, _ = self.translator.quota.allow(content, job_id, priority)
+        if not allowed:
+          continue
+        try:
+          async with self.translation_semaphore:
+            result = await self.translator.translate_sentences(
+                content,
+                language,
+                guild_id=payload.guild_id,
+                bridge_id=job_id)
+        except Exception as e:
+          print(f"Error during translation of edited message: {e}")
+          return
+        translations[language] = result.text
+      part_texts = {part[0]: part[3] for part in post["parts"]}
+      unchanged = part_texts.get(payload.message_id) == translations[language]
+      self.message_map.update_text(post_id, payload.message_id,
+                                   translations[language], digest)
+      if unchanged:
+        continue
+      channel = self.client.get_channel(post["channel_id"])
+      if channel:
+        try:
+          continued = await self.delivery.edit_post(
+              channel, post_id, post["webhook"], self.delivery_items(post),
+              post.get("continued", []))
+          self.message_map.set_continued(post_id, continued)
+        except discord.HTTPException as e:
+          print(f"Failed to edit translated message {post_id}: {e}")
+
+  @commands.Cog.listener()
+  async def on_raw_message_delete(self, payload):
+    for post_id, post in self.message_map.remove_source(payload.message_id):
+      channel = self.client.get_channel(post["channel_id"])
+      if not channel:
+        continue
+      try:
+        if post["parts"]:
+          continued = await self.delivery.edit_post(
+              channel, post_id, post["webhook"], self.delivery_items(post),
+              post.get("continued", []))
+          self.message_map.set_continued(post_id, continued)
+        else:
+          await self.delivery.delete_post(channel, post_id, post["webhook"],
+                                          post.get("continued", []))
+      except discord.HTTPException as e:
+        print(f"Failed to update translated message {post_id}: {e}")
 
   async def target_language_autocomplete(
       self, interaction: discord.Interaction,
@@ -164,12 +307,21 @@ class AutoTranslate(commands.Cog):
   )
   @app_commands.describe(
       source_channel="The channel to be translated from.",
-      target_channel="The channel to post translated messages to.")
+      target_channel="The channel to post translated messages to.",
+      priority="Low priority bridges are paused first when the monthly quota runs low."
+  )
   @app_commands.autocomplete(target_language=target_language_autocomplete)
-  async def set_translate(self, interaction: discord.Interaction,
+  @app_commands.choices(priority=[
+      app_commands.Choice(name="High", value="high"),
+      app_commands.Choice(name="Normal", value="normal"),
+      app_commands.Choice(name="Low", value="low")
+  ])
+  async def set_translate(self,
+                          interaction: discord.Interaction,
                           source_channel: discord.TextChannel,
                           target_channel: discord.TextChannel,
-                          target_language: str):
+                          target_language: str,
+                          priority: str = "normal"):
     if not self.guild_check(interaction):
       await interaction.response.send_message(
           "Your server does not have access to this feature.", ephemeral=True)
@@ -188,11 +340,13 @@ class AutoTranslate(commands.Cog):
     job_id = str(uuid.uuid4())
     job_details = {
         "source_channel": str(source_channel.id),
-        "target_channels": [(str(target_channel.id), target_language)]
+        "target_channels": [(str(target_channel.id), target_language)],
+        "priority": priority
     }
 
     self.translation_mapping[job_id] = job_details
-    self.save_translation_jobs()
+    self.rebuild_routes()
+    await self.storage.translation_jobs.add(job_id, job_details)
 
     await interaction.response.send_message(
         f"Set translations from {source_channel.mention} to {target_channel.mention} in the specified language.",
@@ -19,7 +19,10 @@ class HelpSelect(Select):
                              "Once you have your screenshots, use the `/rss_depletion` command.\n\n"
                              "The command will bring up a form asking you to provide 2 values.\n"
                              "Enter the information requested by the form, and the bot will\n"
-                             "calculate and display the time until resource depletion.\n")),
+                             "calculate and display the time until resource depletion.\n\n"
+                             "For a steadier forecast use `/mill_tracking` and press `Add Reading`\n"
+                             "whenever you check the mill. Every reading refines the rate, misread\n"
+                             "amounts are ignored, and `Finish` saves the rate to the gathering history.\n")),
             'purge_command_help': discord.Embed(
                 title="Purge Command Instructions",
                 description=("The `/purge` command can be used to delete messages from a channel.\n\n"
@@ -51,12 +54,12 @@ class HelpSelect(Select):
                              "     Choose the player from the drop down screen.\n"
                              "     Then click `might` and type in the new player might\n\n"
                              " If you have a list of players with their Flag Capture Might\n"
-                             " use the `/feedback` command to request the list be added for your bot.\n\n"
-                             "**Known issue**\n"
-                             "If for some reason lane 1 shows 19 players and lane 2 shows 21 players\n"
-                             "remove a player from your list of players and run the `/flag_capture_line up`\n"
-                             "command and then re-add the player. Doing this should update the Player list\n"
-                             "and correctly display the lane assignments.")),
+                             " use the `/roster_import` command with a CSV (name,might) or JSON file\n"
+                             " to add or update them all at once. `/roster_export` downloads the list.\n\n"
+                             "`/flag_capture_lineup` splits the strongest players into balanced lanes of\n"
+                             "`lane_size` players each (2 lanes by default, set `lanes` for more) and puts\n"
+                             "everyone else in their own lane. The lineup's description shows how far\n"
+                             "apart the balanced lanes ended up.")),
             'sstimer_help': discord.Embed(
                 title="Screenshot Timer Instructions",
                 description=("`/ss_timer` is simply a one minute timer to help with timing your screenshot \n"
@@ -1,5 +1,4 @@
 import datetime
-import json
 import sys
 
 sys.path.append('/home/usename/.local/lib/python2.7/site-packages/')
@@ -8,6 +7,8 @@ import gspread
 from discord import app_commands
 from discord.ext import commands
 
+from cogs.utils.storage import Player, open_storage
+
 
 class GetFlagData(commands.Cog):
     def __init__(self, client: commands.Bot):
@@ -15,6 +16,10 @@ class GetFlagData(commands.Cog):
         self.gc = gspread.service_account(filename="flagcapturedata-319e906a9631.json")
         self.flag_data_workbook = self.gc.open("FlagData")
         self.allowed_guilds = [383365467894710272, 1045479020940234783]  # guild IDs
+        self.storage = None
+
+    async def cog_load(self):
+        self.storage = await open_storage()
 
     async def guild_is_allowed(self, interaction: discord.Interaction):
         return interaction.guild and interaction.guild.id in self.allowed_guilds
@@ -35,10 +40,14 @@ class GetFlagData(commands.Cog):
             return
         sheet = self.flag_data_workbook.sheet1
         data = sheet.get_all_records()
-        player_list = [{'name': row['Name'], 'might': int(row['Might'])} for row in data if row['Name'] and row['Might']]
-        with open('playerlist.json', 'w', encoding='utf-8') as f:
-            json.dump(player_list, f, ensure_ascii=False, indent=4)
-        await interaction.response.send_message("Data imported and saved successfully into playerlist.json")
+        player_list = {str(row['Name']): Player(name=str(row['Name']), might=int(row['Might'])) for row in data if row['Name'] and row['Might']}
+        # Write through MightDistribution so its cached roster stays current
+        roster_cog = self.client.get_cog('MightDistribution')
+        if roster_cog is not None:
+            await roster_cog.apply_roster(interaction.guild.id, player_list, replace=True)
+        else:
+            await self.storage.players.replace_all(interaction.guild.id, list(player_list.values()))
+        await interaction.response.send_message("Data imported and saved successfully into this server's player list")
 
     @app_commands.command(name='send_flag_data')
     async def update_google_sheet(self, interaction: discord.Interaction):
@@ -48,8 +57,11 @@ class GetFlagData(commands.Cog):
         if not await self.user_is_admin(interaction):
             await interaction.response.send_message("You must be an admin to use this command.", ephemeral=True)
             return
-        with open('playerlist.json', 'r', encoding='utf-8') as f:
-            player_list = json.load(f)
+        roster_cog = self.client.get_cog('MightDistribution')
+        if roster_cog is not None:
+            player_list = await roster_cog.load_player_data(interaction.guild.id)
+        else:
+            player_list = await self.storage.players.list(interaction.guild.id)
 
         values = [['Name', 'Might']] + [[player['name'], player['might']] for player in player_list]
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
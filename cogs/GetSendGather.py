@@ -1,5 +1,3 @@
-import json
-import os
 import sys
 
 import discord
@@ -9,6 +7,8 @@ import gspread
 from discord import app_commands
 from discord.ext import commands
 
+from cogs.utils.storage import GatheringRecord, open_storage
+
 
 class GetSendGather(commands.Cog):
 
@@ -18,6 +18,10 @@ class GetSendGather(commands.Cog):
         filename="flagcapturedata-319e906a9631.json")
     self.flag_data_workbook = self.gc.open("FlagData")
     self.allowed_guilds = [383365467894710272, 1045479020940234783]  # gui
+    self.storage = None
+
+  async def cog_load(self):
+    self.storage = await open_storage()
 
   async def guild_is_allowed(self, interaction: discord.Interaction):
     return interaction.guild and interaction.guild.id in self.allowed_guilds
@@ -28,17 +32,6 @@ class GetSendGather(commands.Cog):
     member = interaction.guild.get_member(interaction.user.id)
     return any(role.name.lower() == 'admin' for role in member.roles)
 
-  def get_guild_specific_filename(self, guild_id: int, base_filename: str = "RssDepletion.json"):
-    """Generates a guild-specific filename for storing data."""
-    return f"cogs/cogfiles/RssDepletion_{guild_id}.json"
-
-  def ensure_file_exists(self, filepath):
-    """Ensure the JSON file for the guild exists. If not, creates an empty JSON list file."""
-    if not os.path.exists(filepath):
-      os.makedirs(os.path.dirname(filepath), exist_ok=True)
-      with open(filepath, 'w', encoding='utf-8') as file:
-        json.dump([], file)
-
   @app_commands.command(name='retrieve_gathering_history')
   async def retrieve_gathering_history(self, interaction):
       if not await self.guild_is_allowed(interaction):
@@ -48,14 +41,17 @@ class GetSendGather(commands.Cog):
         await interaction.response.send_message("You must be an admin to use this command.", ephemeral=True)
         return
 
-      guild_id = interaction.guild.id
-      guild_specific_filename = self.get_guild_specific_filename(guild_id)
-      self.ensure_file_exists(guild_specific_filename)  # Ensure file exists before attempting to write
       sheet = self.flag_data_workbook.worksheet("GatheringHistory")
       data = sheet.get_all_records()
 
-      with open(guild_specific_filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4)
+      # The sheet uses the column headers written by send_gathering_history
+      await self.storage.gathering.replace_all(interaction.guild.id, [
+          GatheringRecord(date_run=str(row['Date']),
+                          resource_type=row['Resource Type'],
+                          occupants=int(row['Occupants']),
+                          gathering_rate=float(row['Gathering Rate']),
+                          ran_by=row['Ran By']) for row in data
+      ])
       await interaction.response.send_message(
           "Gathering history data retrieved successfully.")
 
@@ -68,15 +64,11 @@ class GetSendGather(commands.Cog):
       await interaction.response.send_message("You must be an admin to use this command.", ephemeral=True)
       return
 
-    guild_id = interaction.guild.id
-    guild_specific_filename = self.get_guild_specific_filename(guild_id)
-    self.ensure_file_exists(guild_specific_filename)  # Ensure file exists before attempting to read
-    with open(guild_specific_filename, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = await self.storage.gathering.list(interaction.guild.id)
 
     sheet = self.flag_data_workbook.worksheet("GatheringHistory")
     values = [['Date', 'Resource Type', 'Occupants', 'Gathering Rate', 'Ran By']]
-    values += [[item['date_run'], item['resource_type'], item['number_of_gathers'],
+    values += [[item['date_run'], item['resource_type'], item['occupants'],
                 item['gathering_rate'], item['ran_by']] for item in data]
 
     sheet.clear()
@@ -1,97 +1,305 @@
-
-import json
-import os
-from typing import List, Optional
+import asyncio
+import io
+from typing import Dict, List, Optional
 
 import discord
 from discord import app_commands
 from discord.ext import commands
 
+from cogs.utils.lanes import partition_lanes
+from cogs.utils.name_index import NameIndex
+from cogs.utils.paginator import EmbedPaginator, chunk_lines
+from cogs.utils.roster_io import (
+  MAX_IMPORT_BYTES,
+  MAX_REPORTED_ERRORS,
+  export_csv,
+  export_json,
+  parse_roster,
+)
+from cogs.utils.state_cache import GuildStateCache
+from cogs.utils.storage import Player, open_storage
+
+# Balanced lanes plus the overflow lane must fit in one embed
+MAX_LANES = 10
+PLAYERS_PER_PAGE = 50
+
 
 class MightDistribution(commands.Cog):
 
   def __init__(self, client: commands.Bot):
     self.client = client
+    self.storage = None
+    self.rosters = None  # guild id -> {name: player}, written back lazily
+    self.sorted_rosters = {}  # guild id -> (roster version, sorted players)
+    self.name_indexes = {}  # guild id -> (roster version, NameIndex)
+    self.renders = {}  # guild id -> (roster version, {render key: pages})
 
-  async def load_player_data(self, guild_id: int) -> List[dict]:
-    file_path = f'playerlist_{guild_id}.json'
-    try:
-      with open(file_path, 'r', encoding='utf-8') as file:
-        data = json.load(file)
-    except FileNotFoundError:
-      data = []  # If the file does not exist, start with an empty list
-    return sorted(data, key=lambda x: x.get('might', 0), reverse=True)
-
-  async def save_player_data(self, players: List[dict], guild_id: int) -> None:
-    file_path = f'playerlist_{guild_id}.json'
-    with open(file_path, 'w', encoding='utf-8') as file:
-      json.dump(players, file, indent=4)
-
-  async def prepare_embed(self, guild_id: int, lane_size: int = 20) -> discord.Embed:
-      players = await self.load_player_data(guild_id)
-      # Initial allocation based on the lane_size for the first two lanes
-      lane_allocation_size = lane_size * 2
-      top_players = players[:lane_allocation_size]
-      lane1, lane2 = [], []
-      lane1_might, lane2_might = 0, 0
-
-      for player in top_players:
-          if lane1_might <= lane2_might and len(lane1) < lane_size:
-              lane1.append(player)
-              lane1_might += player['might']
-          elif len(lane2) < lane_size:
-              lane2.append(player)
-              lane2_might += player['might']
-  
-      
-      if len(lane1) < lane_size and (len(players) > lane_allocation_size):
-          # Move a player from the next in list into lane1 if possible
-          lane1.append(players[lane_allocation_size])
-          lane_allocation_size += 1  # Adjust the marker for the start of Lane 3
-
-      # Assigning the remaining players to lane3
-      lane3 = players[lane_allocation_size:]
-      lane3_might = sum(player['might'] for player in lane3)
-
-      # The embedding setup remains the same
-      embed = discord.Embed(
-          title="Flag Capture Lane Setup",
-          description="Players are divided into lanes based on balanced might distribution.",
-          color=0x00ff00)
-
-      for index, (lane, total_might) in enumerate(zip(
-          [lane2, lane3, lane1], [lane2_might, lane3_might, lane1_might]),
-                                                  start=1):
-          lane_description = '\n'.join([
-              f"{idx + 1}. {player['name']}: {player['might']:,}"
-              for idx, player in enumerate(lane)
-          ])
-          lane_description += f"\n**Total Might**: {total_might:,}"
-          embed.add_field(name=f"Lane {index}", value=lane_description, inline=False)
-
-      return embed
-
-  @commands.Cog.listener()
-  async def on_guild_join(self, guild: discord.Guild):
-    file_path = f'playerlist_{guild.id}.json'
-    if not os.path.exists(file_path):
-      with open(file_path, 'w', encoding='utf-8') as file:
-        json.dump([], file, indent=4)  # Initialize with an empty list
+  async def cog_load(self):
+    self.storage = await open_storage()
+    self.rosters = GuildStateCache(self.load_roster,
+                                   self.storage.players.apply_changes)
+
+  async def cog_unload(self):
+    await self.rosters.close()
+
+  async def load_roster(self, guild_id: int) -> dict:
+    return {
+        player['name']: player
+        for player in await self.storage.players.list(guild_id)
+    }
+
+  async def load_player_data(self, guild_id: int) -> List[Player]:
+    # Sorted by might, strongest first; re-sorted only after a change
+    roster = await self.rosters.get(guild_id)
+    version = self.rosters.version(guild_id)
+    cached = self.sorted_rosters.get(guild_id)
+    if cached is None or cached[0] != version:
+      cached = (version,
+                sorted(roster.values(),
+                       key=lambda player: player['might'],
+                       reverse=True))
+      self.sorted_rosters[guild_id] = cached
+    return cached[1]
+
+  async def name_index(self, guild_id: int) -> NameIndex:
+    roster = await self.rosters.get(guild_id)
+    version = self.rosters.version(guild_id)
+    cached = self.name_indexes.get(guild_id)
+    if cached is None or cached[0] != version:
+      cached = (version, NameIndex(roster.values()))
+      self.name_indexes[guild_id] = cached
+    return cached[1]
+
+  async def put_player(self, guild_id: int, player: Player):
+    index = await self.name_index(guild_id)
+    await self.rosters.put(guild_id, player['name'], player)
+    # Keep the index current instead of rebuilding it on the next lookup
+    index.add(player['name'], player['might'])
+    self.name_indexes[guild_id] = (self.rosters.version(guild_id), index)
+
+  async def remove_player(self, guild_id: int, name: str):
+    index = await self.name_index(guild_id)
+    if await self.rosters.delete(guild_id, name):
+      index.remove(name)
+      self.name_indexes[guild_id] = (self.rosters.version(guild_id), index)
+
+  async def apply_roster(self,
+                         guild_id: int,
+                         players: Dict[str, Player],
+                         replace: bool = False) -> Dict[str, List[str]]:
+    """Upsert many players at once and persist them in one write.
+
+    With `replace`, players missing from `players` are removed too.
+    Returns the names added, updated, unchanged and removed.
+    """
+    roster = await self.rosters.get(guild_id)
+    diff = {"added": [], "updated": [], "unchanged": [], "removed": []}
+    changed = {}
+    for name, player in players.items():
+      current = roster.get(name)
+      if current is None:
+        diff["added"].append(name)
+      elif current['might'] != player['might']:
+        diff["updated"].append(name)
+      else:
+        diff["unchanged"].append(name)
+        continue
+      changed[name] = player
+    if replace:
+      diff["removed"] = [name for name in roster if name not in players]
+    await self.rosters.update(guild_id, changed, diff["removed"])
+    await self.rosters.flush()
+    return diff
+
+  def cached_render(self, guild_id: int, key):
+    # Rendered pages stay valid until the roster changes
+    version = self.rosters.version(guild_id)
+    cached = self.renders.get(guild_id)
+    if cached is None or cached[0] != version:
+      return None
+    pages = cached[1].get(key)
+    return None if pages is None else [discord.Embed.from_dict(page) for page in pages]
+
+  def store_render(self, guild_id: int, version: int, key,
+                   pages: List[discord.Embed]):
+    cached = self.renders.get(guild_id)
+    if cached is None or cached[0] != version:
+      cached = (version, {})
+      self.renders[guild_id] = cached
+    # Store plain dicts; the paginator writes page numbers into embeds
+    cached[1][key] = [page.to_dict() for page in pages]
+
+  async def prepare_lineup(self,
+                           guild_id: int,
+                           lane_size: int = 20,
+                           lanes: int = 2) -> List[discord.Embed]:
+    pages = self.cached_render(guild_id, ("lineup", lane_size, lanes))
+    if pages is not None:
+      return pages
+
+    players = await self.load_player_data(guild_id)
+    version = self.rosters.version(guild_id)
+    # The solver is CPU bound, keep it off the event loop
+    split = await asyncio.to_thread(partition_lanes, players, lanes,
+                                    lane_size)
+
+    description = ("Players are divided into lanes based on balanced might distribution.\n"
+                   f"Imbalance between balanced lanes: {split.imbalance:,} "
+                   f"({split.imbalance_ratio:.3%})")
+    # Players that did not fit are shown in the middle lane
+    shown = list(zip(split.lanes, split.totals, strict=True))
+    shown.insert(lanes // 2, (split.overflow, split.overflow_total))
+    fields = []
+    for index, (lane, total_might) in enumerate(shown, start=1):
+      lines = [
+          f"{idx + 1}. {player['name']}: {player['might']:,}"
+          for idx, player in enumerate(lane)
+      ]
+      lines.append(f"**Total Might**: {total_might:,}")
+      fields.append((f"Lane {index}", lines))
+
+    embed = discord.Embed(title="Flag Capture Lane Setup",
+                          description=description,
+                          color=0x00ff00)
+    for name, lines in fields:
+      embed.add_field(name=name, value='\n'.join(lines), inline=False)
+    if all(len(field.value) <= 1024 for field in embed.fields) and len(embed) <= 6000:
+      pages = [embed]
+    else:
+      # Too large for one embed: a summary page, then each lane on its own pages
+      summary = discord.Embed(title="Flag Capture Lane Setup",
+                              description=description,
+                              color=0x00ff00)
+      for (name, lines), (lane, _) in zip(fields, shown, strict=True):
+        summary.add_field(name=name,
+                          value=f"{len(lane)} players\n{lines[-1]}",
+                          inline=False)
+      pages = [summary]
+      for name, lines in fields:
+        for chunk in chunk_lines(lines):
+          pages.append(discord.Embed(title=f"Flag Capture Lane Setup: {name}",
+                                     description=chunk,
+                                     color=0x00ff00))
+
+    self.store_render(guild_id, version, ("lineup", lane_size, lanes), pages)
+    return self.cached_render(guild_id, ("lineup", lane_size, lanes)) or pages
+
+  async def prepare_roster(self, guild_id: int) -> List[discord.Embed]:
+    pages = self.cached_render(guild_id, ("roster", ))
+    if pages is not None:
+      return pages
+    players = await self.load_player_data(guild_id)
+    version = self.rosters.version(guild_id)
+    lines = [f"{player['name']}: {player['might']}" for player in players]
+    pages = [
+        discord.Embed(title="Players List", description=chunk, color=0x00ff00)
+        for chunk in chunk_lines(lines, max_lines=PLAYERS_PER_PAGE)
+    ] or [discord.Embed(title="Players List", color=0x00ff00)]
+    self.store_render(guild_id, version, ("roster", ), pages)
+    return self.cached_render(guild_id, ("roster", )) or pages
 
   @app_commands.command(name="flag_capture_lineup",
                         description="Distributes the might of the players")
-  @app_commands.describe(lane_size="Number of players in each of the first two lanes")
-  async def might_distribution(self, interaction: discord.Interaction, lane_size: int = 20):
+  @app_commands.describe(
+      lane_size="Number of players in each balanced lane",
+      lanes="Number of balanced lanes; players that do not fit get their own lane")
+  async def might_distribution(self,
+                               interaction: discord.Interaction,
+                               lane_size: int = 20,
+                               lanes: int = 2):
     if interaction.guild is not None:
       # Validate lane_size
       if lane_size < 1:
           await interaction.response.send_message("Lane size must be at least 1.", ephemeral=True)
           return
-      embed = await self.prepare_embed(interaction.guild.id, lane_size)
-      await interaction.response.send_message(embed=embed)
+      if not 1 <= lanes <= MAX_LANES:
+          await interaction.response.send_message(
+              f"Lanes must be between 1 and {MAX_LANES}.", ephemeral=True)
+          return
+      pages = await self.prepare_lineup(interaction.guild.id, lane_size, lanes)
+      paginator = EmbedPaginator(pages, interaction.user.id)
+      await interaction.response.send_message(
+          embed=paginator.first_page(), view=paginator.view_for_send())
     else:
       await interaction.response.send_message("This command cannot be used in DMs.", ephemeral=True)
 
+  @app_commands.command(name="roster_import",
+                        description="Add or update many players from a CSV or JSON file")
+  @app_commands.describe(
+      file="CSV with name and might columns, or a JSON list of name/might objects",
+      replace="Also remove players that are not in the file")
+  async def roster_import(self,
+                          interaction: discord.Interaction,
+                          file: discord.Attachment,
+                          replace: bool = False):
+    if interaction.guild is None:
+      await interaction.response.send_message(
+          "This command cannot be used in DMs.", ephemeral=True)
+      return
+    if file.size > MAX_IMPORT_BYTES:
+      await interaction.response.send_message(
+          f"The file is too large, the limit is {MAX_IMPORT_BYTES // 1024} KB.",
+          ephemeral=True)
+      return
+    await interaction.response.defer()
+    try:
+      data = await file.read()
+      parsed = await asyncio.to_thread(parse_roster, data, file.filename)
+    except (discord.HTTPException, ValueError) as e:
+      await interaction.followup.send(f"Could not import {file.filename}: {e}")
+      return
+    if not parsed.players:
+      await interaction.followup.send(
+          f"No valid players found in {file.filename}.")
+      return
+
+    diff = await self.apply_roster(interaction.guild.id, parsed.players,
+                                   replace)
+    embed = discord.Embed(title="Roster Import",
+                          description=f"Read {parsed.rows} rows from {file.filename}.",
+                          color=0x00ff00)
+    for label, names in diff.items():
+      if label == "removed" and not replace:
+        continue
+      preview = ', '.join(names[:10]) + (', ...' if len(names) > 10 else '')
+      embed.add_field(name=f"{label.capitalize()}: {len(names)}",
+                      value=preview or "-",
+                      inline=False)
+    if parsed.duplicates:
+      embed.add_field(name=f"Duplicate rows: {parsed.duplicates}",
+                      value="The last row for each name was used.",
+                      inline=False)
+    if parsed.errors:
+      skipped = '\n'.join(parsed.errors[:MAX_REPORTED_ERRORS])
+      if len(parsed.errors) > MAX_REPORTED_ERRORS:
+        skipped += f"\n... and {len(parsed.errors) - MAX_REPORTED_ERRORS} more"
+      embed.add_field(name=f"Skipped rows: {len(parsed.errors)}",
+                      value=skipped,
+                      inline=False)
+    await interaction.followup.send(embed=embed)
+
+  @app_commands.command(name="roster_export",
+                        description="Download the player list as a CSV or JSON file")
+  @app_commands.choices(file_format=[
+      app_commands.Choice(name="CSV", value="csv"),
+      app_commands.Choice(name="JSON", value="json")
+  ])
+  async def roster_export(self,
+                          interaction: discord.Interaction,
+                          file_format: Optional[app_commands.Choice[str]] = None):
+    if interaction.guild is None:
+      await interaction.response.send_message(
+          "This command cannot be used in DMs.", ephemeral=True)
+      return
+    players = await self.load_player_data(interaction.guild.id)
+    extension = file_format.value if file_format else "csv"
+    data = export_json(players) if extension == "json" else export_csv(players)
+    await interaction.response.send_message(
+        f"{len(players)} players.",
+        file=discord.File(io.BytesIO(data),
+                          filename=f"roster_{interaction.guild.id}.{extension}"),
+        ephemeral=True)
+
   @app_commands.command(
       name="player_upkeep",
       description="Manage player information for flag capture lineup")
@@ -115,10 +323,8 @@ class MightDistribution(commands.Cog):
             "Please provide both a name and a might value.", ephemeral=True)
         return
       if interaction.guild is not None:
-        players = await self.load_player_data(interaction.guild.id)
-        players.append({"name": name, "might": might})
-        await self.save_player_data(players, interaction.guild.id
-                                    )  # Updated with guild_id
+        await self.put_player(interaction.guild.id,
+                              Player(name=name, might=might))
         await interaction.response.send_message(
             f"Added player {name} with might {might}.")
       else:
@@ -131,10 +337,7 @@ class MightDistribution(commands.Cog):
             "Please provide a player name.", ephemeral=True)
         return
       if interaction.guild is not None:
-        players = await self.load_player_data(interaction.guild.id)
-        players = [player for player in players if player['name'] != name]
-        await self.save_player_data(players, interaction.guild.id
-                                    )  # Updated with guild_id
+        await self.remove_player(interaction.guild.id, name)
         await interaction.response.send_message(f"Removed player {name}.")
       else:
         await interaction.response.send_message(
@@ -148,15 +351,13 @@ class MightDistribution(commands.Cog):
         return
 
       if interaction.guild is not None:
-        players = await self.load_player_data(interaction.guild.id)
-        for player in players:
-          if player['name'] == name:
-            player['might'] = might
-            await self.save_player_data(players, interaction.guild.id
-                                        )  # Updated with guild_id
-            await interaction.response.send_message(
-                f"Updated {name}'s might to {might}.")
-            return
+        roster = await self.rosters.get(interaction.guild.id)
+        if name in roster:
+          await self.put_player(interaction.guild.id,
+                                Player(name=name, might=might))
+          await interaction.response.send_message(
+              f"Updated {name}'s might to {might}.")
+          return
         await interaction.response.send_message(f"Player {name} not found.")
       else:
         await interaction.response.send_message(
@@ -166,18 +367,19 @@ class MightDistribution(commands.Cog):
       await self.display_players(interaction)
     elif action.value == "distribute":
       # Code to call might_distribution directly
-      embed = await self.prepare_embed(interaction.guild.id)
-      await interaction.response.send_message(embed=embed)
+      pages = await self.prepare_lineup(interaction.guild.id)
+      paginator = EmbedPaginator(pages, interaction.user.id)
+      await interaction.response.send_message(
+          embed=paginator.first_page(), view=paginator.view_for_send())
 
   # Display players command retained for use within player_upkeep
   async def display_players(self, interaction: discord.Interaction):
     if interaction.guild is not None:
-      players = await self.load_player_data(interaction.guild.id)
-      embed = discord.Embed(title="Players List", color=0x00ff00)
-      display_text = '\n'.join(f"{player['name']}: {player['might']}"
-                               for player in players)
-      embed.description = display_text
-      await interaction.response.send_message(embed=embed, ephemeral=True)
+      pages = await self.prepare_roster(interaction.guild.id)
+      paginator = EmbedPaginator(pages, interaction.user.id)
+      await interaction.response.send_message(embed=paginator.first_page(),
+                                              view=paginator.view_for_send(),
+                                              ephemeral=True)
     else:
       await interaction.response.send_message(
           "This command cannot be used in DMs.", ephemeral=True)
@@ -187,11 +389,12 @@ class MightDistribution(commands.Cog):
       self, interaction: discord.Interaction,
       current: str) -> List[app_commands.Choice[str]]:
     if interaction.guild is not None:
-      players = await self.load_player_data(interaction.guild.id)
+      index = await self.name_index(interaction.guild.id)
+      # Prefix matches first, then substring matches, strongest first
       return [
-          app_commands.Choice(name=player['name'], value=player['name'])
-          for player in players if current.lower() in player['name'].lower()
-      ][:25]  # Limit to 25 entries
+          app_commands.Choice(name=name, value=name)
+          for name in index.search(current, limit=25)
+      ]
     else:
       return []  # Return an empty list if the condition is not met
 
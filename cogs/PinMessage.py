@@ -1,13 +1,46 @@
+import asyncio
+import io
 import json
-import os  # Import os module for path operations
-import sys
 import time
 
 import discord
 from discord import app_commands
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord.ui import Select, View
 
+from cogs.utils.scheduler import DeadlineScheduler
+from cogs.utils.state_cache import GuildStateCache
+from cogs.utils.storage import open_storage
+
+# Channels reposted at the same time; Discord rate limits are per channel,
+# so a slow one only holds up its own slot
+REPOST_CONCURRENCY = 5
+RETRY_DELAY = 60
+
+
+def snapshot_embeds(embeds) -> str:
+  # Link previews are generated by Discord again from the content
+  return json.dumps([embed for embed in embeds if embed.get('type', 'rich') == 'rich'])
+
+
+def snapshot_attachments(attachments) -> str:
+  return json.dumps([{
+      'url': attachment['url'],
+      'filename': attachment['filename']
+  } for attachment in attachments])
+
+
+def snapshot_message(message: discord.Message) -> dict:
+  """What a repost needs, so it never has to fetch the message again."""
+  return {
+      'content': message.content,
+      'embeds': snapshot_embeds(embed.to_dict() for embed in message.embeds),
+      'attachments': snapshot_attachments({
+          'url': attachment.url,
+          'filename': attachment.filename
+      } for attachment in message.attachments)
+  }
+
 
 class PinJobSelect(Select):
 
@@ -29,8 +62,9 @@ class PinJobSelect(Select):
     for job in self.jobs:
       if job['message_id'] == selected_message_id:
         self.jobs.remove(job)
-        await interaction.client.get_cog("PinMessages").save_job(
-            interaction.guild.id)
+        cog = interaction.client.get_cog("PinMessages")
+        await cog.pin_jobs.delete(interaction.guild.id, job['id'])
+        cog.unregister_job(job)
         break
     await interaction.response.send_message(
         f"Stopped pinning message {selected_message_id} and removed from jobs.",
@@ -41,37 +75,74 @@ class PinMessages(commands.Cog):
 
   def __init__(self, client: commands.Bot):
     self.client = client
-    self.jobs = []  # Now stores multiple pin jobs
-    self.jobs_file_base_path = 'cogs/cogfiles/pinjobs'  # Base path without guild ID
-    self.keep_message_at_bottom.start()
+    self.storage = None
+    self.pin_jobs = None  # guild id -> {job id: job}, written back lazily
+    self.registry = {}  # job id -> job, for every guild
+    self.channel_jobs = {}  # channel id -> {job id: job}
+    # job id -> newest message id seen below the pinned copy
+    self.buried = {}
+    self.background = set()  # deletes of replaced copies still running
+    # Buried jobs wait here until their frequency window has passed
+    self.scheduler = DeadlineScheduler(self.repost, concurrency=REPOST_CONCURRENCY)
+
+  async def cog_load(self):
+    self.storage = await open_storage()
+    self.pin_jobs = GuildStateCache(self.load_guild_jobs,
+                                    self.storage.pin_jobs.apply_changes)
+    self.scheduler.start()
+
+  async def cog_unload(self):
+    self.scheduler.close()
+    await self.pin_jobs.close()
 
   @commands.Cog.listener()
   async def on_ready(self):
     print("PinMessages cog is ready.")
-    # No need to load jobs here, since they will be loaded per guild
+    for guild in self.client.guilds:
+      for job in (await self.pin_jobs.get(guild.id)).values():
+        self.register_job(job)
+        # Anything posted while we were offline buries the pin as well;
+        # the gateway gives us each channel's last message for free
+        channel = self.client.get_channel(job['channel_id'])
+        if channel is not None and channel.last_message_id:
+          self.mark_buried(job, channel.last_message_id)
 
-  def get_jobs_file_path(self, guild_id):
-    # Generates a file path unique to each guild
-    return f"{self.jobs_file_base_path}_{guild_id}.json"
+  def register_job(self, job):
+    self.registry[job['id']] = job
+    self.channel_jobs.setdefault(job['channel_id'], {})[job['id']] = job
 
-  async def load_jobs(self, guild_id):
-    jobs_file_path = self.get_jobs_file_path(guild_id)
-    try:
-      if not os.path.exists(jobs_file_path):
-        self.jobs = []  # Reset to empty if file doesn't exist
-        return
+  def unregister_job(self, job):
+    self.registry.pop(job['id'], None)
+    jobs = self.channel_jobs.get(job['channel_id'], {})
+    jobs.pop(job['id'], None)
+    if not jobs:
+      self.channel_jobs.pop(job['channel_id'], None)
+    self.buried.pop(job['id'], None)
+    self.scheduler.cancel(job['id'])
 
-      with open(jobs_file_path, 'r') as f:
-        self.jobs = json.load(f)
-    except Exception as e:
-      print(f"Failed to load jobs for guild {guild_id} due to: {e}",
-            file=sys.stderr)
-      self.jobs = []
+  def mark_buried(self, job, message_id: int):
+    # Snowflakes grow over time, so this also skips our own repost
+    if message_id <= job['message_id']:
+      return
+    self.buried[job['id']] = max(message_id, self.buried.get(job['id'], 0))
+    if not self.scheduler.scheduled(job['id']):
+      self.scheduler.schedule(
+          job['id'],
+          job['last_update_timestamp'] + job['update_frequency'] * 60)
 
-  async def save_job(self, guild_id):
-    jobs_file_path = self.get_jobs_file_path(guild_id)
-    with open(jobs_file_path, 'w') as f:
-      json.dump(self.jobs, f)
+  @commands.Cog.listener()
+  async def on_message(self, message: discord.Message):
+    jobs = self.channel_jobs.get(message.channel.id)
+    if not jobs:
+      return
+    for job in jobs.values():
+      self.mark_buried(job, message.id)
+
+  async def load_guild_jobs(self, guild_id):
+    return {job['id']: job for job in await self.storage.pin_jobs.list(guild_id)}
+
+  async def load_jobs(self, guild_id):
+    return list((await self.pin_jobs.get(guild_id)).values())
 
   @app_commands.command(
       name="pin_message",
@@ -82,68 +153,124 @@ class PinMessages(commands.Cog):
                       interaction: discord.Interaction,
                       message_id: str,
                       frequency_in_minutes: int = 10):
-    await self.load_jobs(
-        interaction.guild_id
-    )  # Ensure we're working with the current guild's jobs
     try:
       message_id_int = int(message_id)
-      new_job = {
-          'channel_id': interaction.channel_id,
-          'message_id': message_id_int,
-          'update_frequency': max(1, frequency_in_minutes),
-          'last_update_timestamp': time.time()
-      }
-      self.jobs.append(new_job)
+      try:
+        message = await interaction.channel.fetch_message(message_id_int)
+      except (discord.NotFound, discord.Forbidden):
+        await interaction.response.send_message(
+            content=f"Could not find message {message_id_int} in this channel.",
+            ephemeral=True)
+        return
+      if not (message.content or message.embeds or message.attachments):
+        await interaction.response.send_message(
+            content=f"Message {message_id_int} has no text, embeds or files to keep at the bottom.",
+            ephemeral=True)
+        return
+      new_job = await self.storage.pin_jobs.add(
+          guild_id=interaction.guild_id,
+          channel_id=interaction.channel_id,
+          message_id=message_id_int,
+          update_frequency=max(1, frequency_in_minutes),
+          last_update_timestamp=time.time(),
+          **snapshot_message(message))
+      # Already stored, so it goes straight into the cache without a flush
+      (await self.pin_jobs.get(interaction.guild_id))[new_job['id']] = new_job
+      self.register_job(new_job)
+      channel = interaction.channel
+      if channel is not None and channel.last_message_id:
+        self.mark_buried(new_job, channel.last_message_id)
       await interaction.response.send_message(
           content=
           f"Message with ID {message_id_int} will now be kept at the bottom of this channel and updated every {new_job['update_frequency']} minute(s).",
           ephemeral=True)
-      await self.save_job(interaction.guild_id)
     except ValueError:
       await interaction.response.send_message(
           content=
           f"Invalid message ID: {message_id}. Please ensure it's a valid integer.",
           ephemeral=True)
 
-  @tasks.loop(seconds=60)
-  async def keep_message_at_bottom(self):
-    for guild in self.client.guilds:
-      await self.load_jobs(guild.id)
-      for job in self.jobs:
-        if time.time(
-        ) - job['last_update_timestamp'] >= job['update_frequency'] * 60:
-          channel = self.client.get_channel(job['channel_id'])
-          if channel:
-            try:
-              messages = [msg async for msg in channel.history(limit=1)]
-              if messages:
-                last_message = messages[0]
-                if last_message.id != job['message_id']:
-                  message = await channel.fetch_message(job['message_id'])
-                  await message.delete()
-                  embeds = message.embeds
-                  new_message = await channel.send(
-                      content=message.content,
-                      embeds=embeds,
-                      allowed_mentions=discord.AllowedMentions.none())
-                  job['message_id'] = new_message.id
-                  job['last_update_timestamp'] = time.time()
-              await self.save_job(guild.id)  # Save changes per guild basis
-            except (discord.NotFound, discord.Forbidden,
-                    discord.HTTPException) as e:
-              print(
-                  f"Error keeping message at bottom for channel {job['channel_id']}: {e}"
-              )
-
-  @keep_message_at_bottom.before_loop
-  async def before_keep_message_at_bottom(self):
-    await self.client.wait_until_ready()
+  @commands.Cog.listener()
+  async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+    jobs = self.channel_jobs.get(payload.channel_id)
+    if not jobs:
+      return
+    for job in jobs.values():
+      if job['message_id'] != payload.message_id:
+        continue
+      # Edits carry only the fields that changed
+      if 'content' in payload.data:
+        job['content'] = payload.data['content']
+      if 'embeds' in payload.data:
+        job['embeds'] = snapshot_embeds(payload.data['embeds'])
+      if 'attachments' in payload.data:
+        job['attachments'] = snapshot_attachments(payload.data['attachments'])
+      self.pin_jobs.touch(job['guild_id'], job['id'])
+
+  async def download_attachments(self, job):
+    files = []
+    for attachment in json.loads(job.get('attachments') or '[]'):
+      try:
+        data = await self.client.http.get_from_cdn(attachment['url'])
+      except (discord.NotFound, discord.Forbidden,
+              discord.HTTPException) as e:
+        # Links expire if nothing refreshed them for about a day
+        print(f"Dropping attachment {attachment['filename']} from pin job {job['id']}: {e}")
+        continue
+      files.append(discord.File(io.BytesIO(data), filename=attachment['filename']))
+    return files
+
+  async def delete_copy(self, channel, message_id: int):
+    try:
+      await channel.get_partial_message(message_id).delete()
+    except discord.NotFound:
+      pass
+    except (discord.Forbidden, discord.HTTPException) as e:
+      print(f"Could not delete old pinned copy {message_id} in channel {channel.id}: {e}")
+
+  async def repost(self, job_id: int):
+    job = self.registry.get(job_id)
+    if job is None or job_id not in self.buried:
+      return
+    channel = self.client.get_channel(job['channel_id'])
+    if channel is None:
+      return
+    try:
+      if job.get('content') is None:
+        # Jobs created before snapshots existed take one the first time
+        job.update(snapshot_message(await channel.fetch_message(job['message_id'])))
+      new_message = await channel.send(
+          content=job['content'] or None,
+          embeds=[discord.Embed.from_dict(embed) for embed in json.loads(job['embeds'] or '[]')],
+          files=await self.download_attachments(job),
+          allowed_mentions=discord.AllowedMentions.none())
+      old_message_id = job['message_id']
+      job['message_id'] = new_message.id
+      job['last_update_timestamp'] = time.time()
+      # Attachment links of the new copy are freshly signed
+      job['attachments'] = snapshot_attachments({
+          'url': attachment.url,
+          'filename': attachment.filename
+      } for attachment in new_message.attachments)
+      self.pin_jobs.touch(job['guild_id'], job['id'])
+      task = asyncio.create_task(self.delete_copy(channel, old_message_id))
+      self.background.add(task)
+      task.add_done_callback(self.background.discard)
+      # Stay buried only if someone posted after the new copy
+      newest = self.buried.pop(job_id, 0)
+      self.mark_buried(job, newest)
+    except (discord.NotFound, discord.Forbidden,
+            discord.HTTPException) as e:
+      print(
+          f"Error keeping message at bottom for channel {job['channel_id']}: {e}"
+      )
+      self.scheduler.schedule(job_id, time.time() + RETRY_DELAY)
 
   @app_commands.command(
       name="stop_pinning",
       description="Stops pinning the message to the bottom of the chat")
   async def stoppinning(self, interaction: discord.Interaction):
-    await self.load_jobs(
+    jobs = await self.load_jobs(
         interaction.guild_id
     )  # Load the current guild's jobs before displaying them
     # Create View
@@ -153,7 +280,7 @@ class PinMessages(commands.Cog):
                           placeholder="Choose a message to stop pinning",
                           min_values=1,
                           max_values=1,
-                          jobs=self.jobs,
+                          jobs=jobs,
                           client=self.client)
     view.add_item(select)
     await interaction.response.send_message(
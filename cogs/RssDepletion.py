@@ -1,40 +1,226 @@
 # Standard library imports
+import asyncio
+import csv
 import datetime
 import json
 import os
+import tempfile
+import time
+from typing import List, Optional
+from urllib.parse import parse_qs, urlparse
 
 # Third-party imports
 import discord
 from discord import Embed, File, app_commands
 from discord.ext import commands
 
+# Local imports
+from cogs.utils.forecast import DepletionTracker
+from cogs.utils.paginator import EmbedPaginator
+from cogs.utils.storage import GatheringRecord, open_storage
+
+THUMBNAIL_PATH = 'files/GasfieldSnip.PNG'
+THUMBNAIL_NAME = 'GasfieldSnip.PNG'
+# Re-upload this long before the signed CDN link expires
+THUMBNAIL_MARGIN = 3600
+# For links without an expiry parameter
+THUMBNAIL_FALLBACK_LIFETIME = 12 * 3600
+
+# The tracking buttons stop working once nobody has used them for this long
+SESSION_TIMEOUT = 6 * 3600
+READINGS_SHOWN = 10
+HISTORY_PAGE_SIZE = 10
+HISTORY_PAGES = 20
+EXPORT_COLUMNS = ['date_run', 'resource_type', 'occupants', 'gathering_rate', 'ran_by']
+
+
+def cdn_url_expiry(url: str) -> Optional[float]:
+    """Unix time a signed Discord CDN link stops working (its hex `ex` param)."""
+    try:
+        return float(int(parse_qs(urlparse(url).query)['ex'][0], 16))
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+def history_window(resource_type: Optional[str], since: Optional[str],
+                   until: Optional[str]) -> dict:
+    """Gathering history filters from command options; `until` is inclusive."""
+    since_date = datetime.date.fromisoformat(since) if since else None
+    until_date = datetime.date.fromisoformat(until) if until else None
+    return {
+        'resource_type': resource_type,
+        'since': since_date.isoformat() if since_date else None,
+        'until': (until_date + datetime.timedelta(days=1)).isoformat() if until_date else None,
+    }
+
+
+def write_export_rows(path: str, file_format: str, rows: List[GatheringRecord], header: bool):
+    with open(path, 'a', encoding='utf-8', newline='') as export_file:
+        if file_format == 'ndjson':
+            export_file.writelines(json.dumps(row) + '\n' for row in rows)
+            return
+        writer = csv.DictWriter(export_file, fieldnames=EXPORT_COLUMNS)
+        if header:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+class TrackingSession:
+    """Readings for one mill, refitted as each one arrives."""
+
+    def __init__(self, guild_id: int, label: str, mill_type: str, gathers: int):
+        self.guild_id = guild_id
+        self.label = label
+        self.mill_type = mill_type
+        self.gathers = gathers
+        self.started = discord.utils.utcnow()
+        self.tracker = DepletionTracker()
+
+    def minute(self, when: datetime.datetime) -> float:
+        return (when - self.started).total_seconds() / 60
+
+    def add_reading(self, amount: float, minutes_ago: float = 0):
+        self.tracker.add(self.minute(discord.utils.utcnow()) - minutes_ago, amount)
+
+    def embed(self) -> discord.Embed:
+        embed = discord.Embed(
+            title=f"{self.label} Depletion Tracking",
+            description=f"Resource Type: {self.mill_type}\nNumber of gathers: {self.gathers}",
+            colour=discord.Colour.blue(),
+            timestamp=discord.utils.utcnow())
+        fit = self.tracker.fit()
+        rejected = set(fit.rejected) if fit else set()
+        readings = self.tracker.readings
+        lines = []
+        # Readings may be entered late ("minutes ago"), list them by time
+        latest = sorted(range(len(readings)), key=lambda index: readings[index][0])
+        for index in latest[-READINGS_SHOWN:]:
+            minute, amount = readings[index]
+            when = self.started + datetime.timedelta(minutes=minute)
+            line = f"<t:{int(when.timestamp())}:t> {amount:,.0f}"
+            lines.append(f"~~{line}~~ (ignored)" if index in rejected else line)
+        embed.add_field(name=f"Readings ({len(readings)})",
+                        value='\n'.join(lines) or "Add a reading to start.",
+                        inline=False)
+
+        if fit is None:
+            embed.set_footer(text="Add at least two readings at different times for a forecast.")
+            return embed
+        if fit.rate <= 0:
+            embed.add_field(name="Gathering Rate",
+                            value="The readings are not going down, check the amounts.",
+                            inline=False)
+            return embed
+
+        now = self.minute(discord.utils.utcnow())
+        rate = f"**{fit.rate:,.0f}** per minute"
+        if fit.rate_error is not None:
+            rate += f" (± {fit.rate_error:,.0f}, 95%)"
+        embed.add_field(name="Gathering Rate", value=rate, inline=False)
+        embed.add_field(name="Estimated Amount Now",
+                        value=f"{max(0.0, fit.amount_at(now)):,.0f}",
+                        inline=False)
+
+        minutes = fit.minutes_left(now)
+        depleted = discord.utils.utcnow() + datetime.timedelta(minutes=minutes)
+        value = f"<t:{int(depleted.timestamp())}:F> (<t:{int(depleted.timestamp())}:R>)"
+        earliest, latest = fit.minutes_left_range(now)
+        if earliest is not None:
+            start = discord.utils.utcnow() + datetime.timedelta(minutes=earliest)
+            end = (f"<t:{int((discord.utils.utcnow() + datetime.timedelta(minutes=latest)).timestamp())}:t>"
+                   if latest is not None else "unknown")
+            value += f"\nBetween <t:{int(start.timestamp())}:t> and {end}"
+        embed.add_field(name="The mill will be depleted by:", value=value, inline=False)
+        embed.set_footer(text=f"Fitted from {fit.used} readings, {len(rejected)} ignored as misreads")
+        return embed
+
+
+class ReadingModal(discord.ui.Modal, title="Add Reading"):
+
+    amount = discord.ui.TextInput(
+        label="Current Amount",
+        style=discord.TextStyle.short,
+        placeholder="Enter the amount left in the mill")
+    minutes_ago = discord.ui.TextInput(
+        label="Minutes Ago (optional)",
+        style=discord.TextStyle.short,
+        placeholder="How long ago the screenshot was taken",
+        required=False)
+
+    def __init__(self, session: TrackingSession, view: "TrackingView"):
+        super().__init__()
+        self.session = session
+        self.tracking_view = view
+
+    async def on_submit(self, interaction: discord.Interaction):
+        try:
+            amount = float(self.amount.value.replace(',', ''))
+            minutes_ago = float(self.minutes_ago.value) if self.minutes_ago.value else 0
+        except ValueError:
+            await interaction.response.send_message("Please enter valid numbers.", ephemeral=True)
+            return
+        self.session.add_reading(amount, minutes_ago)
+        await interaction.response.edit_message(embed=self.session.embed(), view=self.tracking_view)
+
+
+class TrackingView(discord.ui.View):
+
+    def __init__(self, cog: "RssDepletion", session: TrackingSession):
+        super().__init__(timeout=SESSION_TIMEOUT)
+        self.cog = cog
+        self.session = session
+
+    @discord.ui.button(label="Add Reading", style=discord.ButtonStyle.primary)
+    async def add_reading(self, interaction: discord.Interaction, _button: discord.ui.Button):
+        await interaction.response.send_modal(ReadingModal(self.session, self))
+
+    @discord.ui.button(label="Finish", style=discord.ButtonStyle.secondary)
+    async def finish(self, interaction: discord.Interaction, _button: discord.ui.Button):
+        fit = self.session.tracker.fit()
+        if fit is not None and fit.rate > 0:
+            await self.cog.store_depletion_info(
+                self.session.guild_id,
+                discord.utils.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+                self.session.mill_type, self.session.gathers, round(fit.rate, 1),
+                interaction.user.name)
+        for item in self.children:
+            item.disabled = True
+        self.stop()
+        await interaction.response.edit_message(embed=self.session.embed(), view=self)
+
+
 class RssDepletion(commands.Cog):
 
     def __init__(self, client: commands.Bot):
         self.client = client
+        self.storage = None
+        self.thumbnail_url = None
+        self.thumbnail_expires = 0.0
+
+    async def cog_load(self):
+        self.storage = await open_storage()
+
+    def cached_thumbnail(self) -> Optional[str]:
+        if self.thumbnail_url and time.time() < self.thumbnail_expires - THUMBNAIL_MARGIN:
+            return self.thumbnail_url
+        return None
+
+    def remember_thumbnail(self, message: discord.Message):
+        if not message.embeds or not message.embeds[0].thumbnail.url:
+            return
+        url = message.embeds[0].thumbnail.url
+        self.thumbnail_url = url
+        self.thumbnail_expires = cdn_url_expiry(url) or time.time() + THUMBNAIL_FALLBACK_LIFETIME
 
     async def store_depletion_info(self, guild_id: int, date_run: str, resource_type: str,
                                    number_of_gathers: int, gathering_rate: float,
                                    ran_by: str):
-        data = {
-            "Date": date_run,
-            "Resource Type": resource_type,
-            "Occupants": number_of_gathers,
-            "Gathering Rate": gathering_rate,
-            "Ran By": ran_by
-        }
-
-        file_path = f'cogs/cogfiles/RssDepletion_{guild_id}.json'
-        if not os.path.exists(file_path):
-            with open(file_path, 'w', encoding='utf-8') as file:
-                json.dump([], file, indent=4)  # Create a new file with an empty list if it does not exist
-
-        with open(file_path, 'r+', encoding='utf-8') as file:
-            file_data = json.load(file)
-            file_data.append(data)
-            file.seek(0)
-            file.truncate()
-            json.dump(file_data, file, indent=4)
+        await self.storage.gathering.append(guild_id, GatheringRecord(
+            date_run=date_run,
+            resource_type=resource_type,
+            occupants=number_of_gathers,
+            gathering_rate=gathering_rate,
+            ran_by=ran_by))
 
     class RssModal(discord.ui.Modal):
 
@@ -58,20 +244,22 @@ class RssDepletion(commands.Cog):
             placeholder="Enter the number of gathers here")
 
         async def on_submit(self, interaction: discord.Interaction):
-            await interaction.response.defer()
+            # Validate before deferring so errors can still be ephemeral
             try:
                 num1 = float(self.starting_amount.value)
                 num2 = float(self.amount_after_one_minute.value)
                 gathers = int(self.number_of_gathers.value)
             except ValueError:
-                await interaction.response.send_message("Please enter valid numbers.")
+                await interaction.response.send_message("Please enter valid numbers.", ephemeral=True)
                 return
 
             rate = num1 - num2
             if rate <= 0:
                 await interaction.response.send_message(
-                    "Invalid input. The first number must be greater than the second.")
+                    "Invalid input. The first number must be greater than the second.",
+                    ephemeral=True)
                 return
+            await interaction.response.defer()
 
             minutes = num2 / rate
             hours = minutes / 60
@@ -83,11 +271,10 @@ class RssDepletion(commands.Cog):
             number_of_gathers = int(self.number_of_gathers.value)
             gathering_rate = rate  # Assuming 'rate' is the gathering rate calculated above
             ran_by = interaction.user.name  # or interaction.user.display_name for the nickname
-            await self.client.get_cog('RssDepletion').store_depletion_info(
+            cog = self.client.get_cog('RssDepletion')
+            await cog.store_depletion_info(
                 self.guild_id, date_run, resource_type, number_of_gathers, gathering_rate, ran_by)
 
-            file_path = 'files/GasfieldSnip.PNG'
-            file = File(file_path, filename="GasfieldSnip.PNG")
             embed = discord.Embed(
                 title=f"{self.mill_type} Rss Depletion Info",
                 description=(
@@ -98,7 +285,9 @@ class RssDepletion(commands.Cog):
                     f"Resources are being gathered at: **{rate:.0f}** per minute"),
                 colour=discord.Colour.blue(),
                 timestamp=discord.utils.utcnow())
-            embed.set_thumbnail(url="attachment://GasfieldSnip.PNG")
+            # Upload the thumbnail once and reuse its CDN link until it expires
+            thumbnail_url = cog.cached_thumbnail()
+            embed.set_thumbnail(url=thumbnail_url or f"attachment://{THUMBNAIL_NAME}")
             embed.add_field(
                 name="At the current gathering rate, the mill will be depleted in:",
                 value=f"{minutes:.0f} minutes\n{hours:.1f} hours\n{days:.1f} days",
@@ -113,7 +302,12 @@ class RssDepletion(commands.Cog):
             embed.set_footer(
                 text=f"\nThis command was run by {interaction.user.display_name}")
 
-            await interaction.followup.send(file=file, embed=embed)
+            if thumbnail_url:
+                await interaction.followup.send(embed=embed)
+                return
+            message = await interaction.followup.send(
+                file=File(THUMBNAIL_PATH, filename=THUMBNAIL_NAME), embed=embed, wait=True)
+            cog.remember_thumbnail(message)
 
     @app_commands.command(
         name='rss_depletion',
@@ -135,35 +329,164 @@ class RssDepletion(commands.Cog):
                               guild_id=interaction.guild.id)
         await interaction.response.send_modal(modal)
 
+    @app_commands.command(
+        name='mill_tracking',
+        description='Track a mill with any number of readings for a better depletion forecast')
+    @app_commands.describe(
+        gathers="Number of gathers on the mill",
+        label="Name for this mill, to track several of the same type",
+        starting_amount="The amount left right now, if you have it")
+    @app_commands.choices(mill_type=[
+        app_commands.Choice(name="Food", value="Food"),
+        app_commands.Choice(name="Wood", value="Wood"),
+        app_commands.Choice(name="Steel", value="Steel"),
+        app_commands.Choice(name="Gas", value="Gas")
+    ])
+    async def mill_tracking(self, interaction: discord.Interaction,
+                            mill_type: app_commands.Choice[str], gathers: int,
+                            label: Optional[str] = None,
+                            starting_amount: Optional[float] = None):
+        if interaction.guild is None:
+            await interaction.response.send_message("This command cannot be used in DMs.", ephemeral=True)
+            return
+        session = TrackingSession(interaction.guild.id, label or mill_type.value,
+                                  mill_type.value, gathers)
+        if starting_amount is not None:
+            session.add_reading(starting_amount)
+        await interaction.response.send_message(embed=session.embed(),
+                                                view=TrackingView(self, session))
+
     @app_commands.command(
         name='gathering_history',
         description='Displays the history of gathering activities')
-    async def gathering_history(self, interaction: discord.Interaction):
-        file_path = f'cogs/cogfiles/RssDepletion_{interaction.guild.id}.json'
+    @app_commands.describe(
+        resource_type="Only show this resource type",
+        since="First day to include, as YYYY-MM-DD",
+        until="Last day to include, as YYYY-MM-DD")
+    @app_commands.choices(resource_type=[
+        app_commands.Choice(name="Food", value="Food"),
+        app_commands.Choice(name="Wood", value="Wood"),
+        app_commands.Choice(name="Steel", value="Steel"),
+        app_commands.Choice(name="Gas", value="Gas")
+    ])
+    async def gathering_history(self, interaction: discord.Interaction,
+                                resource_type: Optional[app_commands.Choice[str]] = None,
+                                since: Optional[str] = None,
+                                until: Optional[str] = None):
+        if interaction.guild is None:
+            await interaction.response.send_message("This command cannot be used in DMs.", ephemeral=True)
+            return
+        resource = resource_type.value if resource_type else None
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-        except FileNotFoundError:
+            window = history_window(resource, since, until)
+        except ValueError:
+            await interaction.response.send_message("Dates must look like 2024-04-02.", ephemeral=True)
+            return
+
+        guild_id = interaction.guild.id
+        stats = [entry for entry in await self.storage.gathering.stats(guild_id)
+                 if resource is None or entry['resource_type'] == resource]
+        if not stats:
             await interaction.response.send_message('No gathering history found.', ephemeral=True)
             return
 
-        header_text = "Below is the history of all resource gathering activities:"
-        embed = Embed(title='Gathering History', description=header_text, colour=discord.Colour.blue())
+        summary = Embed(title='Gathering History',
+                        description="All-time summary by resource type:",
+                        colour=discord.Colour.blue())
+        for entry in stats:
+            latest = datetime.datetime.fromisoformat(entry['latest_date'])
+            summary.add_field(
+                name=entry['resource_type'],
+                value=(f"Runs: **{entry['runs']}**\xa0\xa0\xa0\xa0"
+                       f"Mean Rate: **{entry['mean_rate']:.0f}**\xa0\xa0\xa0\xa0"
+                       f"Median: **{entry['median_rate']:.0f}**\xa0\xa0\xa0\xa0"
+                       f"90th Percentile: **{entry['p90_rate']:.0f}**\n"
+                       f"Latest: {latest.strftime('%b %d, %H:%M')} UTC, "
+                       f"**{entry['latest_rate']:.0f}** by {entry['latest_by']}"),
+                inline=False)
 
-        for entry in data:
-            date_obj = datetime.datetime.strptime(entry['Date'], '%Y-%m-%d %H:%M:%S')
-            formatted_date = date_obj.strftime('%b %d, %H:%M')  # e.g., Apr 02 00:19
-            # Format the entry as a field
-            entry_description = f"Type: **{entry['Resource Type']}**\xa0\xa0\xa0\xa0Gathering Rate: **{entry['Gathering Rate']}**\xa0\xa0\xa0\xa0Occupants: **{entry['Occupants']}**"
+        # Only the newest entries are paged; filters narrow the rest down
+        total = await self.storage.gathering.count(guild_id, **window)
+        data = await self.storage.gathering.window(
+            guild_id, limit=HISTORY_PAGES * HISTORY_PAGE_SIZE, **window)
+        if total > len(data):
+            summary.description += (f"\n\nThe following pages show the latest {len(data)} of "
+                                    f"{total} matching runs; use `since` and `until` for older ones.")
+        elif not data:
+            summary.description += "\n\nNo runs match the chosen filters."
 
-            embed.add_field(name=f"Date: {formatted_date} UTC",
-                            value=entry_description,
-                            inline=False)
+        pages = [summary]
+        for start in range(0, len(data), HISTORY_PAGE_SIZE):
+            embed = Embed(title='Gathering History', colour=discord.Colour.blue())
+            for entry in data[start:start + HISTORY_PAGE_SIZE]:
+                date_obj = datetime.datetime.fromisoformat(entry['date_run'])
+                formatted_date = date_obj.strftime('%b %d, %H:%M')  # e.g., Apr 02 00:19
+                # Format the entry as a field
+                entry_description = f"Type: **{entry['resource_type']}**\xa0\xa0\xa0\xa0Gathering Rate: **{entry['gathering_rate']}**\xa0\xa0\xa0\xa0Occupants: **{entry['occupants']}**"
+                embed.add_field(name=f"Date: {formatted_date} UTC",
+                                value=entry_description,
+                                inline=False)
+            pages.append(embed)
 
-        if not embed.fields:
-            # If no data was added to the embed
-            embed.description = 'No history data available.'
-        await interaction.response.send_message(embed=embed)
+        paginator = EmbedPaginator(pages, interaction.user.id)
+        await interaction.response.send_message(embed=paginator.first_page(),
+                                                view=paginator.view_for_send())
+
+    @app_commands.command(
+        name='export_gathering_history',
+        description='Download gathering history as a CSV or NDJSON file')
+    @app_commands.describe(
+        file_format="CSV (default) or newline-delimited JSON",
+        resource_type="Only export this resource type",
+        since="First day to include, as YYYY-MM-DD",
+        until="Last day to include, as YYYY-MM-DD")
+    @app_commands.choices(file_format=[
+        app_commands.Choice(name="CSV", value="csv"),
+        app_commands.Choice(name="NDJSON", value="ndjson")
+    ], resource_type=[
+        app_commands.Choice(name="Food", value="Food"),
+        app_commands.Choice(name="Wood", value="Wood"),
+        app_commands.Choice(name="Steel", value="Steel"),
+        app_commands.Choice(name="Gas", value="Gas")
+    ])
+    async def export_gathering_history(self, interaction: discord.Interaction,
+                                       file_format: Optional[app_commands.Choice[str]] = None,
+                                       resource_type: Optional[app_commands.Choice[str]] = None,
+                                       since: Optional[str] = None,
+                                       until: Optional[str] = None):
+        if interaction.guild is None:
+            await interaction.response.send_message("This command cannot be used in DMs.", ephemeral=True)
+            return
+        try:
+            window = history_window(resource_type.value if resource_type else None, since, until)
+        except ValueError:
+            await interaction.response.send_message("Dates must look like 2024-04-02.", ephemeral=True)
+            return
+        extension = file_format.value if file_format else 'csv'
+        await interaction.response.defer(ephemeral=True)
+
+        # Written chunk by chunk to a temporary file, off the event loop
+        handle, path = tempfile.mkstemp(suffix=f'.{extension}')
+        os.close(handle)
+        try:
+            exported = 0
+            async for rows in self.storage.gathering.stream(interaction.guild.id, **window):
+                await asyncio.to_thread(write_export_rows, path, extension, rows, exported == 0)
+                exported += len(rows)
+            if exported == 0:
+                await interaction.followup.send("No gathering history matches those filters.", ephemeral=True)
+                return
+            if os.path.getsize(path) > interaction.guild.filesize_limit:
+                await interaction.followup.send(
+                    "The export is larger than this server's upload limit; narrow it with `since` and `until`.",
+                    ephemeral=True)
+                return
+            await interaction.followup.send(
+                f"Exported {exported} runs.",
+                file=File(path, filename=f"gathering_history_{interaction.guild.id}.{extension}"),
+                ephemeral=True)
+        finally:
+            os.remove(path)
 
 async def setup(client: commands.Bot) -> None:
     await client.add_cog(RssDepletion(client))
\ No newline at end of file
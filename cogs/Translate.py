@@ -1,11 +1,14 @@
+import asyncio
 import json
-import os
+import time
 
-import deepl
 import discord
 from discord import Embed
 from discord.ext import commands
 
+from cogs.utils.paginator import EmbedPaginator
+from cogs.utils.translation import get_translation_service
+
 
 def is_allowed_guild():
     allowed_guild_ids = {1045479020940234783, 383365467894710272}  # Add your guild IDs here
@@ -18,11 +21,14 @@ class Translate(commands.Cog):
 
     def __init__(self, client: commands.Bot):
         self.client = client
-        deepl_key = os.getenv("DEEPLKEY")
-        if deepl_key is None:
-            raise ValueError("DEEPLKEY environment variable is not set")
-        self.translator = deepl.Translator(deepl_key)
+        self.translator = get_translation_service()
         self.language_dict = self.load_language_dict()
+        self.message_cache = {}  # message id -> (message, expires at)
+        self.message_fetches = {}  # message id -> in-flight fetch task
+        self.inflight = set()  # (message id, language) being translated
+        self.posted = {}  # (message id, language) -> (jump url, expires at)
+        self.message_ttl = 60
+        self.posted_ttl = 600
 
     def load_language_dict(self):
         try:
@@ -32,52 +38,131 @@ class Translate(commands.Cog):
             print(f"Failed to load language dictionary: {e}")
             return {}
 
+    @staticmethod
+    def prune(cache):
+        now = time.monotonic()
+        for key in [key for key, (_, expires_at) in cache.items() if expires_at < now]:
+            del cache[key]
+
+    async def get_message(self, channel, message_id):
+        """Fetch a message once, sharing the result with concurrent callers."""
+        cached = self.message_cache.get(message_id)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        task = self.message_fetches.get(message_id)
+        if task is None:
+            task = asyncio.create_task(channel.fetch_message(message_id))
+            self.message_fetches[message_id] = task
+            task.add_done_callback(lambda _: self.message_fetches.pop(message_id, None))
+        message = await asyncio.shield(task)
+        self.prune(self.message_cache)
+        self.message_cache[message_id] = (message, time.monotonic() + self.message_ttl)
+        return message
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload):
+        # An edited message needs a fresh fetch and a fresh translation
+        self.message_cache.pop(payload.message_id, None)
+        for key in [key for key in self.posted if key[0] == payload.message_id]:
+            del self.posted[key]
+
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload):
-        print(f"Reaction received: {payload.emoji}")  # Log received reactions
+        lang_code = self.language_dict.get(str(payload.emoji))
+        if lang_code is None:
+            return
         channel = self.client.get_channel(payload.channel_id)
 
-        messages = []  # Initialize messages as an empty list
-
         # Adapted to fetch the last 10 messages for translating in DMs
         if isinstance(channel, discord.DMChannel):
             messages = [message async for message in channel.history(limit=10)]
-        else:
-            message = None
-            if isinstance(channel, (discord.TextChannel, discord.DMChannel, discord.GroupChannel)):
-                try:
-                    message = await channel.fetch_message(payload.message_id)
-                except discord.NotFound:
-                    return
-                except discord.Forbidden:
-                    return
-                except discord.HTTPException:
-                    return
-                messages = [message]
+            await self.translate_history(channel, messages, lang_code)
+            return
+
+        if not isinstance(channel, (discord.TextChannel, discord.GroupChannel)):
+            return
+
+        key = (payload.message_id, lang_code)
+        posted = self.posted.get(key)
+        if posted and posted[1] > time.monotonic():
+            await channel.send(f"This message was already translated: {posted[0]}",
+                               delete_after=15)
+            return
+        if key in self.inflight:
+            return  # Another reaction is already translating this message
+        self.inflight.add(key)
+        try:
+            try:
+                message = await self.get_message(channel, payload.message_id)
+            except (discord.NotFound, discord.Forbidden, discord.HTTPException):
+                return
+            if not message.content:
+                return
+            sent = await self.translate_message(channel, message, lang_code, payload.guild_id)
+            if sent:
+                self.prune(self.posted)
+                self.posted[key] = (sent.jump_url, time.monotonic() + self.posted_ttl)
+        finally:
+            self.inflight.discard(key)
 
+    async def translate_history(self, channel, messages, lang_code, per_page=3):
+        """Translate a batch of messages in one request and page through the results."""
+        messages = [message for message in reversed(messages) if message.content]
         if not messages:
             return
+        try:
+            results = await self.translator.translate_texts(
+                [message.content for message in messages], lang_code)
+            errors = [None] * len(messages)
+        except Exception as e:
+            # Retry one message at a time so a single bad message only fails itself
+            print(f"Batch translation failed, retrying per message: {e}")
+            outcomes = await asyncio.gather(
+                *(self.translator.translate_text(message.content, lang_code)
+                  for message in messages),
+                return_exceptions=True)
+            results = [None if isinstance(outcome, BaseException) else outcome
+                       for outcome in outcomes]
+            errors = [outcome if isinstance(outcome, BaseException) else None
+                      for outcome in outcomes]
 
-        if str(payload.emoji) in self.language_dict:
-            lang_code = self.language_dict[str(payload.emoji)]
-            for message in messages:
-                try:
-                    result = self.translator.translate_text(message.content,
-                                                            target_lang=lang_code)
-                    translated_message = result.text
-                    detected_lang = result.detected_source_lang
-
-                    embed = Embed(title="Translation", color=0x00ff00)
-                    embed.add_field(name="Original", value=message.content, inline=False)
-                    embed.add_field(name=f"Translated from {detected_lang} to {lang_code}",
-                                    value=translated_message,
+        pages = []
+        for start in range(0, len(messages), per_page):
+            embed = Embed(title="Translation", color=0x00ff00)
+            for message, result, error in zip(messages[start:start + per_page],
+                                              results[start:start + per_page],
+                                              errors[start:start + per_page],
+                                              strict=True):
+                embed.add_field(name=f"Original from {message.author.display_name}",
+                                value=message.content[:1024], inline=False)
+                if error is not None:
+                    embed.add_field(name="Translation failed", value=str(error)[:1024],
                                     inline=False)
-                    if isinstance(channel, (discord.TextChannel, discord.DMChannel, discord.GroupChannel)):
-                        await channel.send(embed=embed)
-                except Exception as e:
-                    if isinstance(channel, (discord.TextChannel, discord.DMChannel, discord.GroupChannel)):
-                        await channel.send(f"Error during translation: {e}")
-                    break  # If an error occurs, break the loop to prevent spamming the channel
+                else:
+                    detected_lang = result.detected_source_lang or "unknown"
+                    embed.add_field(name=f"Translated from {detected_lang} to {lang_code}",
+                                    value=result.text[:1024], inline=False)
+            pages.append(embed)
+
+        paginator = EmbedPaginator(pages)
+        await channel.send(embed=paginator.first_page(), view=paginator.view_for_send())
+
+    async def translate_message(self, channel, message, lang_code, guild_id):
+        try:
+            result = await self.translator.translate_text(message.content,
+                                                          target_lang=lang_code,
+                                                          guild_id=guild_id)
+        except Exception as e:
+            await channel.send(f"Error during translation: {e}")
+            return None
+        detected_lang = result.detected_source_lang or "unknown"
+
+        embed = Embed(title="Translation", color=0x00ff00)
+        embed.add_field(name="Original", value=message.content[:1024], inline=False)
+        embed.add_field(name=f"Translated from {detected_lang} to {lang_code}",
+                        value=result.text[:1024],
+                        inline=False)
+        return await channel.send(embed=embed)
 
 
 async def setup(client: commands.Bot) -> None:
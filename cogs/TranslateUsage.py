@@ -1,20 +1,20 @@
 import datetime
-import os
 
-import deepl
 import discord
 from discord import app_commands
 from discord.ext import commands, tasks
 
+from cogs.utils.quota import POLICY_NAMES
+from cogs.utils.translation import get_translation_service
+
 
 class TranslatorUsage(commands.Cog):
 
   def __init__(self, client: commands.Bot):
     self.client = client
-    deepl_key = os.getenv('DEEPLKEY')
-    if deepl_key is None:
-      raise ValueError("DEEPLKEY environment variable is not set")
-    self.translator = deepl.Translator(deepl_key)
+    self.translator = get_translation_service()
+    # The quota policy applies to every server sharing the DeepL key
+    self.allowed_guild_ids = {1045479020940234783, 383365467894710272}
 
     async def cog_load(self):
       # Make sure the weekly report task starts when the cog is loaded
@@ -43,7 +43,7 @@ class TranslatorUsage(commands.Cog):
       channel_id = 1215338735949062206  # Replace with your actual channel ID
       channel = self.client.get_channel(channel_id)
       if channel:
-        usage = self.translator.get_usage(
+        usage = await self.translator.get_usage(
         )  # Sample usage report retrieval logic
         # Assuming your report generation code stays the same
         embed = discord.Embed(title="Weekly Translator Usage Report",
@@ -75,12 +75,40 @@ class TranslatorUsage(commands.Cog):
       await discord.utils.sleep_until(datetime.datetime.now(datetime.timezone.utc) +
                                       datetime.timedelta(seconds=delay))
 
+  async def cog_load(self):
+    self.sync_quota.start()
+
+  async def cog_unload(self):
+    self.sync_quota.cancel()
+    self.translator.quota.save()
+
+  @tasks.loop(minutes=30)
+  async def sync_quota(self):
+    # get_usage also reconciles the local quota accounting
+    try:
+      await self.translator.get_usage()
+    except Exception as e:
+      print(f"Failed to sync translator usage: {e}")
+
+  async def user_is_admin(self, interaction: discord.Interaction):
+    # interaction.user is already the Member; get_member misses uncached ones
+    if not isinstance(interaction.user, discord.Member):
+      return False
+    return (interaction.permissions.administrator or
+            any(role.name.lower() == 'admin' for role in interaction.user.roles))
+
+  async def can_set_policy(self, interaction: discord.Interaction):
+    if await self.client.is_owner(interaction.user):
+      return True
+    return (interaction.guild_id in self.allowed_guild_ids and
+            await self.user_is_admin(interaction))
+
   @app_commands.command(
       name="check_translator_usage",
       description="Checks the current usage of the translator for this month")
   async def check_translator_usage(self, interaction: discord.Interaction):
     try:
-      usage = self.translator.get_usage()
+      usage = await self.translator.get_usage()
       embed = discord.Embed(title="Translator Usage", color=0x00ff00)
       if usage.any_limit_reached:
         embed.add_field(name="Limit Reached",
@@ -96,12 +124,63 @@ class TranslatorUsage(commands.Cog):
             name="Document Usage",
             value=f"{usage.document.count} of {usage.document.limit}",
             inline=False)
+      quota_state = self.translator.quota.state
+      if interaction.guild_id is not None:
+        guild_characters = quota_state["guilds"].get(str(interaction.guild_id),
+                                                     0)
+        embed.add_field(name="This Server",
+                        value=f"{guild_characters:,} characters this month",
+                        inline=False)
+      top_bridges = sorted(quota_state["bridges"].items(),
+                           key=lambda item: item[1],
+                           reverse=True)[:5]
+      if top_bridges:
+        embed.add_field(name="Busiest Translation Jobs",
+                        value="\n".join(f"`{job_id[:8]}`: {count:,}"
+                                        for job_id, count in top_bridges),
+                        inline=False)
+      cache_stats = self.translator.cache.stats()
+      embed.add_field(
+          name="Translation Cache",
+          value=(f"{cache_stats['memory_hits'] + cache_stats['disk_hits']} hits "
+                 f"({cache_stats['disk_hits']} from disk), "
+                 f"{cache_stats['misses']} misses, "
+                 f"{cache_stats['hit_rate']:.0%} hit rate"),
+          inline=False)
 
       await interaction.response.send_message(embed=embed)
     except Exception as e:
       await interaction.response.send_message(
           content=f"Failed to retrieve usage information: {str(e)}")
 
+  @app_commands.command(
+      name="translation_quota_policy",
+      description=
+      "Set the share of the monthly quota at which a translation policy starts")
+  @app_commands.describe(
+      policy="The policy to configure",
+      percent="Quota percentage that triggers the policy (over 100 disables it)")
+  @app_commands.choices(policy=[
+      app_commands.Choice(name=name, value=name) for name in POLICY_NAMES
+  ])
+  async def translation_quota_policy(self, interaction: discord.Interaction,
+                                     policy: app_commands.Choice[str],
+                                     percent: int):
+    if not await self.can_set_policy(interaction):
+      await interaction.response.send_message(
+          "You must be the bot owner or an admin of a translation server to "
+          "use this command.",
+          ephemeral=True)
+      return
+    if percent < 1:
+      await interaction.response.send_message(
+          "The percentage must be at least 1.", ephemeral=True)
+      return
+    await self.translator.quota.set_policy(policy.value, percent / 100)
+    await interaction.response.send_message(
+        f"The {policy.value} policy now starts at {percent}% of the monthly quota.",
+        ephemeral=True)
+
 
 async def setup(client: commands.Bot) -> None:
   await client.add_cog(TranslatorUsage(client))
@@ -0,0 +1,26 @@
+import contextlib
+import os
+import tempfile
+
+
+def write_text_atomic(path: str, text: str):
+  """Write `text` to `path` so readers never see a half-written file.
+
+  The text goes to a temporary file in the same directory, which then
+  replaces `path` in one step. Blocking; call it through a thread from
+  the event loop.
+  """
+  directory = os.path.dirname(path) or '.'
+  handle, temp_path = tempfile.mkstemp(dir=directory,
+                                       prefix=f".{os.path.basename(path)}.",
+                                       suffix='.tmp')
+  try:
+    with os.fdopen(handle, 'w') as temp_file:
+      temp_file.write(text)
+      temp_file.flush()
+      os.fsync(temp_file.fileno())
+    os.replace(temp_path, path)
+  except BaseException:
+    with contextlib.suppress(OSError):
+      os.remove(temp_path)
+    raise
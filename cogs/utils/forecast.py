@@ -0,0 +1,164 @@
+import math
+from statistics import median
+from typing import List, Optional, Tuple
+
+# Two-sided 95% Student t critical values by degrees of freedom; larger
+# samples fall back to the closest smaller entry, then to the normal 1.96
+T_CRITICAL = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365,
+    8: 2.306, 9: 2.262, 10: 2.228, 15: 2.131, 20: 2.086, 30: 2.042
+}
+# Readings further than this many robust standard deviations from the fit
+# are treated as misreads
+OUTLIER_CUTOFF = 3.5
+# Readings are whole numbers, so residuals under one unit are just rounding
+MIN_SCALE = 1.0
+# Readings are also taken by hand at slightly uneven times, so on a busy
+# mill residuals this small relative to a minute of gathering, or to the
+# amount itself, are jitter rather than misreads
+MIN_SCALE_OF_RATE = 0.01
+MIN_SCALE_OF_AMOUNT = 1e-5
+# Outlier rejection needs enough readings left to fit a line with error
+MIN_READINGS_FOR_REJECTION = 4
+
+
+def t_critical(degrees_of_freedom: int) -> float:
+  if degrees_of_freedom > 30:
+    return 1.96
+  return T_CRITICAL[max(df for df in T_CRITICAL if df <= degrees_of_freedom)]
+
+
+class Sums:
+  """Running sums for least squares, updated one reading at a time."""
+
+  def __init__(self):
+    self.n = 0
+    self.t = self.y = self.tt = self.ty = self.yy = 0.0
+
+  def add(self, t: float, y: float, weight: int = 1):
+    self.n += weight
+    self.t += weight * t
+    self.y += weight * y
+    self.tt += weight * t * t
+    self.ty += weight * t * y
+    self.yy += weight * y * y
+
+  def copy(self) -> "Sums":
+    other = Sums()
+    other.n, other.t, other.y = self.n, self.t, self.y
+    other.tt, other.ty, other.yy = self.tt, self.ty, self.yy
+    return other
+
+  def line(self) -> Optional[Tuple[float, float, float]]:
+    """(intercept, slope, residual sum of squares), or None if degenerate."""
+    if self.n < 2:
+      return None
+    sxx = self.tt - self.t * self.t / self.n
+    if sxx <= 1e-12:
+      return None
+    sxy = self.ty - self.t * self.y / self.n
+    syy = self.yy - self.y * self.y / self.n
+    slope = sxy / sxx
+    intercept = (self.y - slope * self.t) / self.n
+    return intercept, slope, max(0.0, syy - slope * sxy)
+
+  def sxx(self) -> float:
+    return self.tt - self.t * self.t / self.n
+
+
+class RateFit:
+  """Result of `DepletionTracker.fit`; times are minutes since the start."""
+
+  def __init__(self, intercept: float, slope: float,
+               rate_error: Optional[float], used: int, rejected: List[int]):
+    self.intercept = intercept
+    self.slope = slope
+    self.rate_error = rate_error  # half-width of the 95% interval
+    self.used = used
+    self.rejected = rejected  # indexes of readings treated as misreads
+
+  @property
+  def rate(self) -> float:
+    """Resources gathered per minute."""
+    return -self.slope
+
+  def amount_at(self, minute: float) -> float:
+    return self.intercept + self.slope * minute
+
+  def minutes_left(self, minute: float,
+                   rate: Optional[float] = None) -> Optional[float]:
+    """Minutes from `minute` until the mill runs dry, None if never."""
+    rate = self.rate if rate is None else rate
+    if rate <= 0:
+      return None
+    return max(0.0, self.amount_at(minute)) / rate
+
+  def minutes_left_range(
+      self, minute: float) -> Tuple[Optional[float], Optional[float]]:
+    """Earliest and latest depletion within the 95% interval of the rate."""
+    if self.rate_error is None:
+      return None, None
+    return (self.minutes_left(minute, self.rate + self.rate_error),
+            self.minutes_left(minute, self.rate - self.rate_error))
+
+
+class DepletionTracker:
+  """Readings of one mill's remaining amount, fitted as a straight line.
+
+  Each reading updates running sums, so refitting costs one pass over the
+  residuals to look for misreads. Readings far from the robust (median
+  absolute deviation) spread of the residuals are left out of the fit.
+  """
+
+  def __init__(self):
+    self.readings: List[Tuple[float, float]] = []  # (minute, amount)
+    self.sums = Sums()
+
+  def add(self, minute: float, amount: float):
+    self.readings.append((minute, amount))
+    self.sums.add(minute, amount)
+
+  def min_scale(self, slope: float) -> float:
+    """Smallest residual spread the readings are assumed to have."""
+    mean_amount = self.sums.y / self.sums.n
+    return max(MIN_SCALE, MIN_SCALE_OF_RATE * abs(slope),
+               MIN_SCALE_OF_AMOUNT * abs(mean_amount))
+
+  def fit(self) -> Optional[RateFit]:
+    line = self.sums.line()
+    if line is None:
+      return None
+    intercept, slope, _ = line
+    min_scale = self.min_scale(slope)
+
+    rejected = []
+    if len(self.readings) >= MIN_READINGS_FOR_REJECTION:
+      residuals = [amount - (intercept + slope * minute)
+                   for minute, amount in self.readings]
+      center = median(residuals)
+      spread = median(abs(residual - center) for residual in residuals)
+      cutoff = OUTLIER_CUTOFF * max(1.4826 * spread, min_scale)
+      rejected = [
+          index for index, residual in enumerate(residuals)
+          if abs(residual - center) > cutoff
+      ]
+      if len(self.readings) - len(rejected) < 3:
+        rejected = []
+
+    sums = self.sums
+    if rejected:
+      sums = self.sums.copy()
+      for index in rejected:
+        sums.add(*self.readings[index], weight=-1)
+      line = sums.line()
+      if line is None:
+        return None
+
+    intercept, slope, residual_sum = line
+    rate_error = None
+    if sums.n > 2:
+      # Perfectly collinear readings would otherwise claim an exact rate
+      variance = max(residual_sum / (sums.n - 2), min_scale**2)
+      standard_error = math.sqrt(variance / sums.sxx())
+      rate_error = t_critical(sums.n - 2) * standard_error
+    return RateFit(intercept, slope, rate_error, sums.n, rejected)
@@ -0,0 +1,137 @@
+import heapq
+import time
+from bisect import bisect_left
+from typing import List, Sequence
+
+from cogs.utils.storage import Player
+
+# Seconds the swap search may spend polishing the differencing result
+DEFAULT_TIME_LIMIT = 0.5
+
+
+class LaneSplit:
+  """Outcome of `partition_lanes`.
+
+  `lanes` are the balanced lanes, `overflow` holds the players that did not
+  fit, and `imbalance` is the gap between the strongest and weakest
+  balanced lane.
+  """
+
+  def __init__(self, lanes: List[List[Player]], overflow: List[Player]):
+    self.lanes = lanes
+    self.overflow = overflow
+    self.totals = [lane_might(lane) for lane in lanes]
+    self.overflow_total = lane_might(overflow)
+
+  @property
+  def imbalance(self) -> int:
+    if not self.totals:
+      return 0
+    return max(self.totals) - min(self.totals)
+
+  @property
+  def imbalance_ratio(self) -> float:
+    """Imbalance relative to the average balanced lane."""
+    if not self.totals or not sum(self.totals):
+      return 0.0
+    return self.imbalance / (sum(self.totals) / len(self.totals))
+
+
+def lane_might(lane: Sequence[Player]) -> int:
+  return sum(player['might'] for player in lane)
+
+
+def _difference(players: List[Player], lane_count: int) -> List[List[Player]]:
+  """Balanced largest differencing (Karmarkar-Karp with equal lane sizes).
+
+  Players, strongest first, are cut into rows of `lane_count`; each row is a
+  partial split with one player per lane. The two partial splits with the
+  widest spread are merged by pairing the heaviest lanes of one with the
+  lightest of the other, until one split is left. Every merge adds one
+  player to every lane, so lane sizes never differ by more than one.
+  """
+  heap = []
+  for row_index in range(0, len(players), lane_count):
+    row = players[row_index:row_index + lane_count]
+    lanes = [[player] for player in row]
+    lanes += [[] for _ in range(lane_count - len(row))]
+    totals = [lane_might(lane) for lane in lanes]
+    order = sorted(range(lane_count), key=totals.__getitem__, reverse=True)
+    split = [(totals[index], lanes[index]) for index in order]
+    # Ties broken by row index so the heap never compares lanes
+    heapq.heappush(heap, (-(split[0][0] - split[-1][0]), row_index, split))
+
+  while len(heap) > 1:
+    _, row_index, first = heapq.heappop(heap)
+    _, _, second = heapq.heappop(heap)
+    merged = [(first[index][0] + second[-1 - index][0],
+               first[index][1] + second[-1 - index][1])
+              for index in range(lane_count)]
+    merged.sort(key=lambda lane: lane[0], reverse=True)
+    heapq.heappush(heap,
+                   (-(merged[0][0] - merged[-1][0]), row_index, merged))
+
+  if not heap:
+    return [[] for _ in range(lane_count)]
+  return [lane for _, lane in heap[0][2]]
+
+
+def _improve(lanes: List[List[Player]], deadline: float):
+  """Swap players between the heaviest and lightest lane while it helps.
+
+  Each round looks for the swap whose might difference comes closest to
+  half the gap between those two lanes, which is the swap that narrows it
+  the most. Stops when no swap helps or the deadline passes.
+  """
+  totals = [lane_might(lane) for lane in lanes]
+  while time.perf_counter() < deadline:
+    heavy = max(range(len(lanes)), key=totals.__getitem__)
+    light = min(range(len(lanes)), key=totals.__getitem__)
+    gap = totals[heavy] - totals[light]
+    if gap <= 0:
+      return
+
+    light_lane = sorted(lanes[light], key=lambda player: player['might'])
+    light_might = [player['might'] for player in light_lane]
+    best = None
+    for heavy_index, player in enumerate(lanes[heavy]):
+      # Swapping in a player of might m narrows the gap to |gap - 2d|,
+      # d = player - m, so look for m near player - gap / 2
+      target = player['might'] - gap / 2
+      position = bisect_left(light_might, target)
+      for light_index in (position - 1, position):
+        if 0 <= light_index < len(light_lane):
+          delta = player['might'] - light_might[light_index]
+          new_gap = abs(gap - 2 * delta)
+          if delta > 0 and new_gap < gap and (best is None or
+                                              new_gap < best[0]):
+            best = (new_gap, heavy_index, light_lane[light_index], delta)
+    if best is None:
+      return
+
+    _, heavy_index, light_player, delta = best
+    lanes[light].remove(light_player)
+    lanes[light].append(lanes[heavy][heavy_index])
+    lanes[heavy][heavy_index] = light_player
+    totals[heavy] -= delta
+    totals[light] += delta
+
+
+def partition_lanes(players: List[Player],
+                    lane_count: int,
+                    lane_size: int,
+                    time_limit: float = DEFAULT_TIME_LIMIT) -> LaneSplit:
+  """Split the strongest players into `lane_count` lanes of equal might.
+
+  The top `lane_count * lane_size` players (by might) are spread so each
+  lane holds at most `lane_size` of them and the lane totals are as even
+  as possible; everyone else goes to the overflow lane. CPU bound, so
+  callers on the event loop should run it in a thread.
+  """
+  ranked = sorted(players, key=lambda player: player['might'], reverse=True)
+  seated = ranked[:lane_count * lane_size]
+  lanes = _difference(seated, lane_count)
+  _improve(lanes, time.perf_counter() + time_limit)
+  for lane in lanes:
+    lane.sort(key=lambda player: player['might'], reverse=True)
+  return LaneSplit(lanes, ranked[lane_count * lane_size:])
@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from cogs.utils.atomic_file import write_text_atomic
+
+MESSAGE_MAP_FILE = 'cogs/cogfiles/TranslatedMessages.json'
+
+
+def content_digest(text: str) -> str:
+  """Short fingerprint of a source message's text."""
+  return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class TranslatedMessageMap:
+  """Bounded, persisted map from source messages to their translated posts.
+
+  Posts are stored by their own message id with the parts they were built
+  from, because a coalesced post carries several source messages. The
+  oldest posts are forgotten once `max_posts` is exceeded, and changes are
+  written to disk at most once every `save_delay` seconds.
+  """
+
+  def __init__(self,
+               path: str = MESSAGE_MAP_FILE,
+               max_posts: int = 5000,
+               save_delay: float = 30):
+    self.path = path
+    self.max_posts = max_posts
+    self.save_delay = save_delay
+    # post id -> {"channel_id", "language", "webhook", "parts", "continued"},
+    # where each part is [source message id, author name, avatar url,
+    # translated text, digest of the source text] and "continued" lists the ids of the messages a long
+    # post spilled over into
+    self.posts = OrderedDict()
+    self.by_source = {}  # source message id -> set of post ids
+    self.save_task: Optional[asyncio.Task] = None
+    self.load()
+
+  def load(self):
+    if not os.path.exists(self.path):
+      return
+    try:
+      with open(self.path, 'r') as map_file:
+        posts = json.load(map_file)
+    except Exception as e:
+      print(f"Failed to load translated message map: {e}")
+      return
+    for post_id, post in posts.items():
+      self._insert(int(post_id), post)
+
+  def _dump(self) -> str:
+    return json.dumps({str(post_id): post
+                       for post_id, post in self.posts.items()})
+
+  def save(self):
+    """Write the map from a blocking context, e.g. while unloading."""
+    try:
+      write_text_atomic(self.path, self._dump())
+    except Exception as e:
+      print(f"Failed to save translated message map: {e}")
+
+  async def save_async(self):
+    """Write the map from a thread so the event loop keeps running."""
+    text = self._dump()
+    try:
+      await asyncio.to_thread(write_text_atomic, self.path, text)
+    except Exception as e:
+      print(f"Failed to save translated message map: {e}")
+
+  def schedule_save(self):
+    if self.save_task is None or self.save_task.done():
+      self.save_task = asyncio.create_task(self._save_later())
+
+  async def _save_later(self):
+    await asyncio.sleep(self.save_delay)
+    await self.save_async()
+
+  def _insert(self, post_id: int, post: dict):
+    self.posts[post_id] = post
+    for part in post["parts"]:
+      self.by_source.setdefault(part[0], set()).add(post_id)
+    while len(self.posts) > self.max_posts:
+      oldest_id, _ = next(iter(self.posts.items()))
+      self.discard_post(oldest_id)
+
+  def add_post(self, channel_id: int, post_id: int, language: str,
+               webhook: bool, parts: List[list],
+               continued: Optional[List[int]] = None):
+    self._insert(
+        post_id, {
+            "channel_id": channel_id,
+            "language": language,
+            "webhook": webhook,
+            "parts": parts,
+            "continued": continued or []
+        })
+    self.schedule_save()
+
+  def set_continued(self, post_id: int, continued: List[int]):
+    post = self.posts.get(post_id)
+    if post is not None and post.get("continued", []) != continued:
+      post["continued"] = continued
+      self.schedule_save()
+
+  def posts_for(self, source_id: int) -> List[Tuple[int, dict]]:
+    return [(post_id, self.posts[post_id])
+            for post_id in self.by_source.get(source_id, ())
+            if post_id in self.posts]
+
+  def source_digest(self, post_id: int, source_id: int) -> Optional[str]:
+    for part in self.posts[post_id]["parts"]:
+      # Posts saved before digests were kept have four fields
+      if part[0] == source_id and len(part) > 4:
+        return part[4]
+    return None
+
+  def update_text(self, post_id: int, source_id: int, text: str,
+                  digest: Optional[str] = None):
+    for part in self.posts[post_id]["parts"]:
+      if part[0] == source_id:
+        part[3] = text
+        part[4:] = [digest]
+    self.schedule_save()
+
+  def remove_source(self, source_id: int) -> List[Tuple[int, dict]]:
+    """Drop a source message from its posts and return the posts it was in."""
+    affected = self.posts_for(source_id)
+    for post_id, post in affected:
+      post["parts"] = [part for part in post["parts"] if part[0] != source_id]
+      if not post["parts"]:
+        del self.posts[post_id]
+    self.by_source.pop(source_id, None)
+    self.schedule_save()
+    return affected
+
+  def discard_post(self, post_id: int):
+    post = self.posts.pop(post_id, None)
+    if post is None:
+      return
+    for part in post["parts"]:
+      post_ids = self.by_source.get(part[0])
+      if post_ids is not None:
+        post_ids.discard(post_id)
+        if not post_ids:
+          del self.by_source[part[0]]
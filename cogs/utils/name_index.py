@@ -0,0 +1,88 @@
+import heapq
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Set
+
+# Every substring up to this length is indexed; longer queries intersect
+# the postings of their grams and confirm the match on the name itself
+GRAM_LENGTH = 3
+
+
+def _grams(key: str) -> Set[str]:
+  return {
+      key[start:start + length]
+      for length in range(1, GRAM_LENGTH + 1)
+      for start in range(len(key) - length + 1)
+  }
+
+
+class NameIndex:
+  """In-memory player-name lookup for autocomplete.
+
+  Names are kept in a sorted list of case-folded keys for prefix matches
+  and in an n-gram index for substring matches, so a lookup touches only
+  the names that can match instead of scanning the roster.
+  """
+
+  def __init__(self, players: Iterable[dict] = ()):
+    self.might: Dict[str, int] = {}  # name -> might
+    self.keys: List[str] = []  # sorted case-folded names
+    self.names: Dict[str, Set[str]] = {}  # case-folded name -> names
+    self.postings: Dict[str, Set[str]] = {}  # gram -> case-folded names
+    for player in players:
+      self.add(player['name'], player['might'])
+
+  def add(self, name: str, might: int):
+    """Add a player or update their might."""
+    if name in self.might:
+      self.might[name] = might
+      return
+    self.might[name] = might
+    key = name.casefold()
+    if key not in self.names:
+      self.names[key] = set()
+      insort(self.keys, key)
+      for gram in _grams(key):
+        self.postings.setdefault(gram, set()).add(key)
+    self.names[key].add(name)
+
+  def remove(self, name: str):
+    if self.might.pop(name, None) is None:
+      return
+    key = name.casefold()
+    self.names[key].discard(name)
+    if self.names[key]:
+      return
+    del self.names[key]
+    del self.keys[bisect_left(self.keys, key)]
+    for gram in _grams(key):
+      self.postings[gram].discard(key)
+      if not self.postings[gram]:
+        del self.postings[gram]
+
+  def _ranked(self, keys: Iterable[str], limit: int) -> List[str]:
+    names = (name for key in keys for name in self.names[key])
+    return heapq.nlargest(limit, names, key=self.might.__getitem__)
+
+  def search(self, query: str, limit: int = 25) -> List[str]:
+    """Names starting with `query`, then names containing it.
+
+    Each group is ordered by might, strongest first.
+    """
+    query = query.casefold()
+    start = bisect_left(self.keys, query)
+    end = bisect_left(self.keys, query + "\U0010ffff")
+    prefixed = self.keys[start:end]
+    results = self._ranked(prefixed, limit)
+    if len(results) >= limit or not query:
+      return results
+
+    grams = ({query} if len(query) <= GRAM_LENGTH else {
+        query[start:start + GRAM_LENGTH]
+        for start in range(len(query) - GRAM_LENGTH + 1)
+    })
+    postings = sorted((self.postings.get(gram, set()) for gram in grams),
+                      key=len)
+    candidates = set.intersection(*postings) if postings else set()
+    candidates.difference_update(prefixed)
+    containing = (key for key in candidates if query in key)
+    return results + self._ranked(containing, limit - len(results))
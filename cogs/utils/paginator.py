@@ -0,0 +1,83 @@
+from typing import List, Optional
+
+import discord
+from discord.ui import Button, View
+
+# Embed description limit
+MAX_DESCRIPTION_LENGTH = 4096
+
+
+def chunk_lines(lines: List[str],
+                limit: int = MAX_DESCRIPTION_LENGTH,
+                max_lines: Optional[int] = None) -> List[str]:
+  """Join lines into as few blocks as possible, each at most `limit` long."""
+  chunks = []
+  current = []
+  length = 0
+  for line in lines:
+    line = line[:limit]
+    full = max_lines is not None and len(current) >= max_lines
+    if current and (full or length + 1 + len(line) > limit):
+      chunks.append('\n'.join(current))
+      current, length = [], 0
+    length += len(line) + (1 if current else 0)
+    current.append(line)
+  if current:
+    chunks.append('\n'.join(current))
+  return chunks
+
+
+class EmbedPaginator(View):
+  """Previous/next buttons over a fixed list of embeds."""
+
+  def __init__(self,
+               pages: List[discord.Embed],
+               user_id: Optional[int] = None,
+               timeout: float = 300):
+    super().__init__(timeout=timeout)
+    self.pages = pages
+    self.user_id = user_id
+    self.index = 0
+    if len(pages) > 1:
+      for number, page in enumerate(pages, start=1):
+        page.set_footer(text=f"Page {number} of {len(pages)}")
+    self.previous_button = Button(label="Previous",
+                                  style=discord.ButtonStyle.secondary)
+    self.next_button = Button(label="Next", style=discord.ButtonStyle.primary)
+    self.previous_button.callback = self.previous_page
+    self.next_button.callback = self.next_page
+    self.add_item(self.previous_button)
+    self.add_item(self.next_button)
+    self.update_buttons()
+
+  def update_buttons(self):
+    self.previous_button.disabled = self.index == 0
+    self.next_button.disabled = self.index >= len(self.pages) - 1
+
+  async def interaction_check(self, interaction: discord.Interaction) -> bool:
+    if self.user_id is not None and interaction.user.id != self.user_id:
+      await interaction.response.send_message(
+          "Only the person who ran the command can change pages.",
+          ephemeral=True)
+      return False
+    return True
+
+  async def show(self, interaction: discord.Interaction):
+    self.update_buttons()
+    await interaction.response.edit_message(embed=self.pages[self.index],
+                                            view=self)
+
+  async def previous_page(self, interaction: discord.Interaction):
+    self.index = max(0, self.index - 1)
+    await self.show(interaction)
+
+  async def next_page(self, interaction: discord.Interaction):
+    self.index = min(len(self.pages) - 1, self.index + 1)
+    await self.show(interaction)
+
+  def first_page(self) -> discord.Embed:
+    return self.pages[0]
+
+  def view_for_send(self) -> Optional["EmbedPaginator"]:
+    """The view to attach when sending, or None for a single page."""
+    return self if len(self.pages) > 1 else None
@@ -0,0 +1,153 @@
+import asyncio
+import datetime
+import json
+import os
+import random
+import time
+from typing import Optional, Tuple
+
+from cogs.utils.atomic_file import write_text_atomic
+
+QUOTA_FILE = 'cogs/cogfiles/TranslationQuota.json'
+
+# Fraction of the monthly character limit at which each policy kicks in.
+# A threshold above 1 effectively disables that policy.
+DEFAULT_POLICY = {
+    "throttle_at": 0.75,
+    "throttle_per_minute": 20,  # translations per bridge per minute
+    "sample_at": 0.85,
+    "sample_rate": 0.5,  # share of messages still translated
+    "long_only_at": 0.9,
+    "min_length": 40,  # characters a message needs once long_only applies
+    "pause_low_priority_at": 0.95,
+}
+
+POLICY_NAMES = ("throttle", "sample", "long_only", "pause_low_priority")
+
+
+def current_month() -> str:
+  return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m")
+
+
+class QuotaGovernor:
+  """Local DeepL character accounting plus policies applied near the limit.
+
+  Every character sent to DeepL is counted per guild and per bridge (an
+  AutoTranslate job id). `sync` reconciles the running total with
+  `get_usage` from time to time, so `allow` can decide from local numbers
+  without spending an API call per message.
+  """
+
+  def __init__(self, path: str = QUOTA_FILE):
+    self.path = path
+    self.state = self.load()
+    self.buckets = {}  # bridge id -> (tokens, last refill time)
+    self.save_lock = asyncio.Lock()
+
+  def empty_state(self, policy: Optional[dict] = None) -> dict:
+    return {
+        "month": current_month(),
+        "guilds": {},
+        "bridges": {},
+        "synced_count": 0,  # DeepL's own count at the last sync
+        "since_sync": 0,  # characters we sent after the last sync
+        "limit": None,
+        "last_sync": None,
+        "policy": dict(policy or DEFAULT_POLICY),
+    }
+
+  def load(self) -> dict:
+    if not os.path.exists(self.path):
+      return self.empty_state()
+    try:
+      with open(self.path, 'r') as quota_file:
+        state = json.load(quota_file)
+    except Exception as e:
+      print(f"Failed to load translation quota state: {e}")
+      return self.empty_state()
+    state["policy"] = {**DEFAULT_POLICY, **state.get("policy", {})}
+    return state
+
+  def save(self):
+    """Write the state from a blocking context, e.g. while shutting down."""
+    try:
+      write_text_atomic(self.path, json.dumps(self.state, indent=4))
+    except Exception as e:
+      print(f"Failed to save translation quota state: {e}")
+
+  async def save_async(self):
+    """Write the state from a thread so the event loop keeps running."""
+    text = json.dumps(self.state, indent=4)
+    async with self.save_lock:
+      try:
+        await asyncio.to_thread(write_text_atomic, self.path, text)
+      except Exception as e:
+        print(f"Failed to save translation quota state: {e}")
+
+  def _roll_month(self):
+    if self.state["month"] != current_month():
+      self.state = self.empty_state(self.state["policy"])
+
+  def usage_ratio(self) -> float:
+    limit = self.state["limit"]
+    if not limit:
+      return 0.0
+    return (self.state["synced_count"] + self.state["since_sync"]) / limit
+
+  def record(self, characters: int, guild_id: Optional[int] = None,
+             bridge_id: Optional[str] = None):
+    self._roll_month()
+    self.state["since_sync"] += characters
+    if guild_id is not None:
+      guilds = self.state["guilds"]
+      guilds[str(guild_id)] = guilds.get(str(guild_id), 0) + characters
+    if bridge_id is not None:
+      bridges = self.state["bridges"]
+      bridges[bridge_id] = bridges.get(bridge_id, 0) + characters
+
+  async def apply_usage(self, usage):
+    """Reconcile local totals with a `deepl.Usage` report."""
+    self._roll_month()
+    if usage.character.valid:
+      self.state["synced_count"] = usage.character.count
+      self.state["limit"] = usage.character.limit
+      self.state["since_sync"] = 0
+      self.state["last_sync"] = time.time()
+    await self.save_async()
+
+  async def set_policy(self, name: str, threshold: float):
+    self.state["policy"][f"{name}_at"] = threshold
+    await self.save_async()
+
+  def _take_token(self, bridge_id: str) -> bool:
+    rate = self.state["policy"]["throttle_per_minute"] / 60
+    capacity = self.state["policy"]["throttle_per_minute"]
+    now = time.monotonic()
+    tokens, last = self.buckets.get(bridge_id, (capacity, now))
+    tokens = min(capacity, tokens + (now - last) * rate)
+    if tokens < 1:
+      self.buckets[bridge_id] = (tokens, now)
+      return False
+    self.buckets[bridge_id] = (tokens - 1, now)
+    return True
+
+  def allow(self, text: str, bridge_id: str,
+            priority: str = "normal") -> Tuple[bool, Optional[str]]:
+    """Return (allowed, name of the policy that refused it)."""
+    self._roll_month()
+    ratio = self.usage_ratio()
+    policy = self.state["policy"]
+    if ratio >= 1:
+      return False, "limit"
+    if priority == "low" and ratio >= policy["pause_low_priority_at"]:
+      return False, "pause_low_priority"
+    if priority == "high":
+      return True, None
+    if ratio >= policy["long_only_at"] and len(text) < policy["min_length"]:
+      return False, "long_only"
+    if ratio >= policy["sample_at"] and random.random() >= policy[
+        "sample_rate"]:
+      return False, "sample"
+    if ratio >= policy["throttle_at"] and not self._take_token(bridge_id):
+      return False, "throttle"
+    return True, None
@@ -0,0 +1,136 @@
+import csv
+import io
+import json
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from cogs.utils.storage import Player
+
+# Largest roster file accepted from an attachment
+MAX_IMPORT_BYTES = 1024 * 1024
+# Autocomplete choices cannot be longer than this
+MAX_NAME_LENGTH = 100
+MAX_REPORTED_ERRORS = 10
+
+
+class RosterImport:
+  """Players read from an import file, deduplicated by name.
+
+  A name that appears more than once keeps its last row. Rows that could
+  not be used are described in `errors`, one string per row.
+  """
+
+  def __init__(self):
+    self.players: Dict[str, Player] = {}
+    self.rows = 0
+    self.duplicates = 0
+    self.errors: List[str] = []
+
+  def add(self, row: int, name, might):
+    self.rows += 1
+    name = str(name if name is not None else '').strip()
+    if not name:
+      self.errors.append(f"row {row}: missing name")
+      return
+    if len(name) > MAX_NAME_LENGTH:
+      self.errors.append(f"row {row}: name longer than {MAX_NAME_LENGTH}")
+      return
+    try:
+      might = parse_might(might)
+    except ValueError:
+      self.errors.append(f"row {row}: invalid might for {name}")
+      return
+    if name in self.players:
+      self.duplicates += 1
+    self.players[name] = Player(name=name, might=might)
+
+
+def parse_might(value) -> int:
+  """Accept 12345678, "12,345,678" or "12 345 678"; never negative."""
+  if isinstance(value, bool):
+    raise ValueError(value)
+  if isinstance(value, (int, float)):
+    might = int(value)
+  else:
+    text = str(value).strip().replace(',', '').replace(' ', '').replace('_', '')
+    might = int(text)
+  if might < 0:
+    raise ValueError(value)
+  return might
+
+
+def _iter_csv(lines: Iterable[str]) -> Iterator[Tuple[int, object, object]]:
+  reader = csv.reader(lines)
+  name_column, might_column = 0, 1
+  first = True
+  for row in reader:
+    if not any(cell.strip() for cell in row):
+      continue
+    if first:
+      # An optional header row may put the columns in any order
+      first = False
+      header = [cell.strip().lower() for cell in row]
+      if 'name' in header and 'might' in header:
+        name_column, might_column = header.index('name'), header.index('might')
+        continue
+    if len(row) <= max(name_column, might_column):
+      yield reader.line_num, None, None
+      continue
+    yield reader.line_num, row[name_column], row[might_column]
+
+
+def _iter_json(text: str) -> Iterator[Tuple[int, object, object]]:
+  """Decode a JSON array or newline-delimited objects one at a time."""
+  decoder = json.JSONDecoder()
+  position = 0
+  item = 0
+  while True:
+    while position < len(text) and text[position] in ' \t\r\n,[':
+      position += 1
+    if position >= len(text) or text[position] == ']':
+      return
+    entry, position = decoder.raw_decode(text, position)
+    item += 1
+    if isinstance(entry, dict):
+      name = entry.get('name', entry.get('Name'))
+      might = entry.get('might', entry.get('Might'))
+      yield item, name, might
+    else:
+      yield item, None, None
+
+
+def parse_roster(data: bytes, filename: str) -> RosterImport:
+  """Parse a CSV (name,might) or JSON roster file.
+
+  Raises ValueError when the file cannot be read at all.
+  """
+  try:
+    text = data.decode('utf-8-sig')
+  except UnicodeDecodeError:
+    raise ValueError("The file must be UTF-8 text.") from None
+
+  result = RosterImport()
+  if filename.lower().endswith(('.json', '.ndjson', '.jsonl')):
+    rows = _iter_json(text)
+  else:
+    rows = _iter_csv(io.StringIO(text, newline=''))
+  try:
+    for line, name, might in rows:
+      result.add(line, name, might)
+  except (json.JSONDecodeError, csv.Error) as e:
+    raise ValueError(f"Could not parse {filename}: {e}") from e
+  return result
+
+
+def export_csv(players: Iterable[Player]) -> bytes:
+  output = io.StringIO(newline='')
+  writer = csv.writer(output)
+  writer.writerow(['name', 'might'])
+  for player in players:
+    writer.writerow([player['name'], player['might']])
+  return output.getvalue().encode('utf-8')
+
+
+def export_json(players: Iterable[Player]) -> bytes:
+  return json.dumps([dict(player) for player in players],
+                    indent=2,
+                    ensure_ascii=False).encode('utf-8')
@@ -0,0 +1,90 @@
+import asyncio
+import contextlib
+import heapq
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Set, Tuple
+
+
+class DeadlineScheduler:
+  """Run `handler(key)` when each key's deadline passes.
+
+  Deadlines sit in a min-heap, so the worker sleeps exactly until the
+  earliest one instead of polling. Rescheduling or cancelling a key only
+  updates `deadlines`; heap entries that no longer match are skipped when
+  they surface. Due keys run concurrently, at most `concurrency` at a
+  time, and a key never runs twice at once.
+  """
+
+  def __init__(self,
+               handler: Callable[[Any], Awaitable[None]],
+               concurrency: int = 5):
+    self.handler = handler
+    self.semaphore = asyncio.Semaphore(concurrency)
+    self.heap: List[Tuple[float, int, Any]] = []  # (deadline, seq, key)
+    self.deadlines: Dict[Any, float] = {}
+    self.running: Set[Any] = set()
+    self.counter = 0  # heap tie-breaker, keys need not be comparable
+    self.wakeup = asyncio.Event()
+    self.worker = None
+    self.tasks: Set[asyncio.Task] = set()
+
+  def start(self):
+    if self.worker is None or self.worker.done():
+      self.worker = asyncio.create_task(self._run())
+
+  def schedule(self, key, deadline: float):
+    """Run `key` at unix time `deadline`, replacing any earlier schedule."""
+    self.deadlines[key] = deadline
+    self.counter += 1
+    heapq.heappush(self.heap, (deadline, self.counter, key))
+    self.wakeup.set()
+
+  def cancel(self, key):
+    self.deadlines.pop(key, None)
+
+  def scheduled(self, key) -> bool:
+    return key in self.deadlines
+
+  def _pop_due(self, now: float) -> List[Any]:
+    due = []
+    while self.heap and self.heap[0][0] <= now:
+      deadline, _, key = heapq.heappop(self.heap)
+      if self.deadlines.get(key) == deadline:
+        del self.deadlines[key]
+        due.append(key)
+    return due
+
+  async def _run(self):
+    while True:
+      # Drop stale entries so the sleep below targets a live deadline
+      while self.heap and self.deadlines.get(self.heap[0][2]) != self.heap[0][0]:
+        heapq.heappop(self.heap)
+      self.wakeup.clear()
+      timeout = None
+      if self.heap:
+        timeout = max(0.0, self.heap[0][0] - time.time())
+      if timeout is None or timeout > 0:
+        with contextlib.suppress(asyncio.TimeoutError):
+          await asyncio.wait_for(self.wakeup.wait(), timeout)
+      for key in self._pop_due(time.time()):
+        if key in self.running:
+          continue
+        self.running.add(key)
+        task = asyncio.create_task(self._handle(key))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+  async def _handle(self, key):
+    try:
+      async with self.semaphore:
+        await self.handler(key)
+    except Exception as e:
+      print(f"Scheduled job {key} failed: {e}")
+    finally:
+      self.running.discard(key)
+
+  def close(self):
+    if self.worker is not None:
+      self.worker.cancel()
+    for task in self.tasks:
+      task.cancel()
@@ -0,0 +1,130 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple
+
+# (guild id, key, value) to write and (guild id, key) to delete
+Upserts = List[Tuple[int, Any, Any]]
+Deletes = List[Tuple[int, Any]]
+
+
+class GuildStateCache:
+  """Per-guild, in-memory state with debounced write-back.
+
+  Each guild's state is a dict loaded once with `load(guild_id)` and then
+  served from memory. Mutations go through `put` and `delete`, which only
+  record the changed keys; shortly afterwards every pending change, across
+  all guilds, is handed to `flush(upserts, deletes)` as one batch so the
+  storage layer can write it in a single transaction. `close` flushes
+  whatever is still pending.
+  """
+
+  def __init__(self,
+               load: Callable[[int], Awaitable[Dict[Any, Any]]],
+               flush: Callable[[Upserts, Deletes], Awaitable[None]],
+               delay: float = 5.0):
+    self.load = load
+    self.flush_changes = flush
+    self.delay = delay
+    self.states: Dict[int, Dict[Any, Any]] = {}
+    # Bumped on every change so callers can cache derived views
+    self.versions: Dict[int, int] = {}
+    self.dirty: Dict[Tuple[int, Any], bool] = {}  # -> True when deleted
+    self.load_locks: Dict[int, asyncio.Lock] = {}
+    self.flush_lock = asyncio.Lock()
+    self.flush_task = None
+    self.debouncing = False  # flush_task is still in its sleep
+
+  async def get(self, guild_id: int) -> Dict[Any, Any]:
+    state = self.states.get(guild_id)
+    if state is not None:
+      return state
+    lock = self.load_locks.setdefault(guild_id, asyncio.Lock())
+    async with lock:
+      if guild_id not in self.states:
+        self.states[guild_id] = await self.load(guild_id)
+        self.versions.setdefault(guild_id, 0)
+    return self.states[guild_id]
+
+  def version(self, guild_id: int) -> int:
+    return self.versions.get(guild_id, 0)
+
+  def _changed(self, guild_id: int, key, deleted: bool):
+    self.versions[guild_id] = self.versions.get(guild_id, 0) + 1
+    self.dirty[(guild_id, key)] = deleted
+    if self.flush_task is None or self.flush_task.done():
+      self.flush_task = asyncio.create_task(self._flush_later())
+
+  async def put(self, guild_id: int, key, value):
+    state = await self.get(guild_id)
+    state[key] = value
+    self._changed(guild_id, key, deleted=False)
+
+  async def update(self, guild_id: int, values: Dict[Any, Any],
+                   deleted: Iterable = ()):
+    """Apply many changes to one guild at once; they flush together."""
+    state = await self.get(guild_id)
+    for key, value in values.items():
+      state[key] = value
+      self._changed(guild_id, key, deleted=False)
+    for key in deleted:
+      if state.pop(key, None) is not None:
+        self._changed(guild_id, key, deleted=True)
+
+  def touch(self, guild_id: int, key):
+    """Record that a value already in the state was modified in place."""
+    self._changed(guild_id, key, deleted=False)
+
+  async def delete(self, guild_id: int, key) -> bool:
+    state = await self.get(guild_id)
+    if key not in state:
+      return False
+    del state[key]
+    self._changed(guild_id, key, deleted=True)
+    return True
+
+  async def _flush_later(self):
+    self.debouncing = True
+    try:
+      await asyncio.sleep(self.delay)
+    finally:
+      self.debouncing = False
+    await self.flush()
+    # Changes made while the flush ran found this task still running and
+    # scheduled nothing; a failed flush has already scheduled its retry
+    if self.dirty and self.flush_task is asyncio.current_task():
+      self.flush_task = asyncio.create_task(self._flush_later())
+
+  async def flush(self):
+    async with self.flush_lock:
+      if not self.dirty:
+        return
+      pending, self.dirty = self.dirty, {}
+      upserts = []
+      deletes = []
+      for (guild_id, key), deleted in pending.items():
+        value = self.states.get(guild_id, {}).get(key)
+        if deleted or value is None:
+          deletes.append((guild_id, key))
+        else:
+          upserts.append((guild_id, key, value))
+      try:
+        await self.flush_changes(upserts, deletes)
+      except asyncio.CancelledError:
+        # Put the changes back so a later flush still writes them
+        for change, deleted in pending.items():
+          self.dirty.setdefault(change, deleted)
+        raise
+      except Exception as e:
+        print(f"Failed to flush cached state, will retry: {e}")
+        for change, deleted in pending.items():
+          self.dirty.setdefault(change, deleted)
+        self.flush_task = asyncio.create_task(self._flush_later())
+
+  async def close(self):
+    task = self.flush_task
+    if task is not None and not task.done():
+      if self.debouncing:
+        task.cancel()
+      else:
+        # Already writing; cancelling it would drop the batch it holds
+        await task
+    await self.flush()
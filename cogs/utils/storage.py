@@ -0,0 +1,763 @@
+import asyncio
+import glob
+import json
+import math
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, TypedDict
+
+DB_PATH = 'cogs/cogfiles/bot.sqlite3'
+
+# Roster written by /get_flag_data, which is not tied to a guild
+GLOBAL_ROSTER_ID = 0
+
+
+class Player(TypedDict):
+  name: str
+  might: int
+
+
+class GatheringRecord(TypedDict):
+  date_run: str
+  resource_type: str
+  occupants: int
+  gathering_rate: float
+  ran_by: str
+
+
+class GatheringStats(TypedDict):
+  resource_type: str
+  runs: int
+  mean_rate: float
+  median_rate: float
+  p90_rate: float
+  latest_date: str
+  latest_rate: float
+  latest_by: str
+
+
+class PinJob(TypedDict):
+  id: int
+  guild_id: int
+  channel_id: int
+  message_id: int
+  update_frequency: int
+  last_update_timestamp: float
+  # Snapshot of the pinned message; JSON lists for embeds and attachments.
+  # None until the message has been seen.
+  content: Optional[str]
+  embeds: Optional[str]
+  attachments: Optional[str]
+
+
+class TranslationJob(TypedDict, total=False):
+  source_channel: str
+  target_channels: List[List[str]]
+  priority: str
+
+
+SCHEMA = """
+CREATE TABLE players (
+    guild_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    might INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, name)
+);
+CREATE TABLE gathering_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    date_run TEXT NOT NULL,
+    resource_type TEXT NOT NULL,
+    occupants INTEGER NOT NULL,
+    gathering_rate REAL NOT NULL,
+    ran_by TEXT NOT NULL
+);
+CREATE INDEX gathering_history_guild ON gathering_history (guild_id);
+CREATE TABLE pin_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    update_frequency INTEGER NOT NULL,
+    last_update_timestamp REAL NOT NULL
+);
+CREATE INDEX pin_jobs_guild ON pin_jobs (guild_id);
+CREATE TABLE translation_jobs (
+    job_id TEXT PRIMARY KEY,
+    source_channel INTEGER NOT NULL,
+    priority TEXT NOT NULL DEFAULT 'normal'
+);
+CREATE TABLE translation_targets (
+    job_id TEXT NOT NULL REFERENCES translation_jobs (job_id) ON DELETE CASCADE,
+    target_channel INTEGER NOT NULL,
+    target_language TEXT NOT NULL
+);
+CREATE INDEX translation_targets_job ON translation_targets (job_id);
+"""
+
+
+def read_json(path, default):
+  try:
+    with open(path, 'r', encoding='utf-8') as file:
+      return json.load(file)
+  except (OSError, json.JSONDecodeError) as e:
+    print(f"Skipping {path} during import: {e}")
+    return default
+
+
+def guild_from_path(path) -> Optional[int]:
+  match = re.search(r"_(\d+)\.json$", path)
+  return int(match.group(1)) if match else None
+
+
+def required_text(value) -> str:
+  if value is None or not str(value).strip():
+    raise ValueError("empty value")
+  return str(value)
+
+
+def convert_rows(path, rows, convert) -> list:
+  """Convert each legacy row on its own, skipping the ones that don't fit.
+
+  Old files were edited by hand and copied from sheets, so a bad row is
+  logged and dropped instead of failing the whole migration.
+  """
+  if not isinstance(rows, list):
+    print(f"Skipping {path} during import: expected a list")
+    return []
+  converted = []
+  for index, row in enumerate(rows):
+    try:
+      converted.append(convert(row))
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+      print(f"Skipping row {index} of {path} during import: {e!r}")
+  return converted
+
+
+def import_json_files(connection: sqlite3.Connection):
+  """Copy the per-guild JSON files the cogs used before into the database.
+
+  The files are left where they are; the schema version guarantees this
+  runs only once. Rows that cannot be read are skipped.
+  """
+  rosters = [(guild_from_path(path), path)
+             for path in glob.glob('playerlist_*.json')]
+  if os.path.exists('playerlist.json'):
+    rosters.append((GLOBAL_ROSTER_ID, 'playerlist.json'))
+  for guild_id, path in rosters:
+    if guild_id is None:
+      continue
+    connection.executemany(
+        "INSERT OR REPLACE INTO players (guild_id, name, might) "
+        "VALUES (?, ?, ?)",
+        convert_rows(
+            path, read_json(path, []), lambda player, guild_id=guild_id:
+            (guild_id, required_text(player['name']),
+             int(player.get('might') or 0))))
+
+  for path in glob.glob('cogs/cogfiles/RssDepletion_*.json'):
+    guild_id = guild_from_path(path)
+    if guild_id is None:
+      continue
+    connection.executemany(
+        "INSERT INTO gathering_history (guild_id, date_run, resource_type, "
+        "occupants, gathering_rate, ran_by) VALUES (?, ?, ?, ?, ?, ?)",
+        convert_rows(
+            path, read_json(path, []), lambda entry, guild_id=guild_id:
+            (guild_id, required_text(entry['Date']),
+             required_text(entry['Resource Type']), int(entry['Occupants']),
+             float(entry['Gathering Rate']), str(entry.get('Ran By') or ''))))
+
+  for path in glob.glob('cogs/cogfiles/pinjobs_*.json'):
+    guild_id = guild_from_path(path)
+    if guild_id is None:
+      continue
+    connection.executemany(
+        "INSERT INTO pin_jobs (guild_id, channel_id, message_id, "
+        "update_frequency, last_update_timestamp) VALUES (?, ?, ?, ?, ?)",
+        convert_rows(
+            path, read_json(path, []), lambda job, guild_id=guild_id:
+            (guild_id, int(job['channel_id']), int(job['message_id']),
+             max(1, int(job['update_frequency'])),
+             float(job.get('last_update_timestamp') or 0))))
+
+  translate_jobs = read_json('cogs/cogfiles/TranslateJobs.json', {}) \
+      if os.path.exists('cogs/cogfiles/TranslateJobs.json') else {}
+  if not isinstance(translate_jobs, dict):
+    print("Skipping cogs/cogfiles/TranslateJobs.json during import: "
+          "expected an object")
+    translate_jobs = {}
+  for job_id, job_details in translate_jobs.items():
+    try:
+      source_channel = int(job_details["source_channel"])
+      priority = str(job_details.get("priority") or "normal")
+      targets = [(job_id, int(target_channel), required_text(target_language))
+                 for target_channel, target_language in
+                 job_details["target_channels"]]
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+      print(f"Skipping translation job {job_id} during import: {e!r}")
+      continue
+    connection.execute(
+        "INSERT INTO translation_jobs (job_id, source_channel, priority) "
+        "VALUES (?, ?, ?)", (job_id, source_channel, priority))
+    connection.executemany("INSERT INTO translation_targets VALUES (?, ?, ?)",
+                           targets)
+
+
+# Gathering history is append-only; these indexes let readers seek straight
+# to a date window, optionally for one resource type
+GATHERING_INDEXES = """
+DROP INDEX gathering_history_guild;
+CREATE INDEX gathering_history_date ON gathering_history (guild_id, date_run);
+CREATE INDEX gathering_history_resource
+    ON gathering_history (guild_id, resource_type, date_run);
+"""
+
+# Per guild and resource type aggregates, kept current as history is
+# appended so summaries never scan the whole history. Bare columns next to
+# MAX() come from the row holding the maximum, i.e. the latest run.
+REBUILD_GATHERING_STATS = """
+INSERT INTO gathering_stats (guild_id, resource_type, runs, rate_sum,
+                             latest_date, latest_rate, latest_by)
+SELECT guild_id, resource_type, COUNT(*), SUM(gathering_rate), MAX(date_run),
+       gathering_rate, ran_by
+FROM gathering_history {where}
+GROUP BY guild_id, resource_type
+"""
+
+GATHERING_STATS = """
+CREATE TABLE gathering_stats (
+    guild_id INTEGER NOT NULL,
+    resource_type TEXT NOT NULL,
+    runs INTEGER NOT NULL,
+    rate_sum REAL NOT NULL,
+    latest_date TEXT NOT NULL,
+    latest_rate REAL NOT NULL,
+    latest_by TEXT NOT NULL,
+    PRIMARY KEY (guild_id, resource_type)
+);
+CREATE INDEX gathering_history_rate
+    ON gathering_history (guild_id, resource_type, gathering_rate);
+""" + REBUILD_GATHERING_STATS.format(where="")
+
+# Gathering rates are counted per distinct value and per bucket of values
+# within RATE_BUCKET_BASE of each other, so a percentile reads the bucket
+# counts, then the distinct rates of one bucket, however long the history
+RATE_BUCKET_BASE = 1.01
+# Bucket for rates of zero or less, below every positive rate's bucket
+NONPOSITIVE_BUCKET = -2**31
+
+
+def rate_bucket(rate: float) -> int:
+  if rate <= 0:
+    return NONPOSITIVE_BUCKET
+  return math.floor(math.log(rate, RATE_BUCKET_BASE))
+
+
+REBUILD_GATHERING_RATES = """
+INSERT INTO gathering_rate_counts (guild_id, resource_type, bucket,
+                                   gathering_rate, runs)
+SELECT guild_id, resource_type, rate_bucket(gathering_rate), gathering_rate,
+       COUNT(*)
+FROM gathering_history {where}
+GROUP BY guild_id, resource_type, gathering_rate;
+INSERT INTO gathering_rate_buckets (guild_id, resource_type, bucket, runs)
+SELECT guild_id, resource_type, bucket, SUM(runs)
+FROM gathering_rate_counts {where}
+GROUP BY guild_id, resource_type, bucket
+"""
+
+GATHERING_RATE_HISTOGRAM = """
+CREATE TABLE gathering_rate_counts (
+    guild_id INTEGER NOT NULL,
+    resource_type TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    gathering_rate REAL NOT NULL,
+    runs INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, resource_type, bucket, gathering_rate)
+);
+CREATE TABLE gathering_rate_buckets (
+    guild_id INTEGER NOT NULL,
+    resource_type TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    runs INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, resource_type, bucket)
+);
+DROP INDEX gathering_history_rate;
+""" + REBUILD_GATHERING_RATES.format(where="")
+
+# Pin jobs repost from a stored copy instead of fetching the message
+PIN_JOB_SNAPSHOTS = """
+ALTER TABLE pin_jobs ADD COLUMN content TEXT;
+ALTER TABLE pin_jobs ADD COLUMN embeds TEXT;
+ALTER TABLE pin_jobs ADD COLUMN attachments TEXT;
+"""
+
+# Each entry upgrades the schema by one version. Entries are SQL scripts or
+# functions taking the connection; each runs in its own transaction.
+MIGRATIONS = [
+    SCHEMA,
+    import_json_files,
+    GATHERING_INDEXES,
+    GATHERING_STATS,
+    PIN_JOB_SNAPSHOTS,
+    GATHERING_RATE_HISTOGRAM,
+]
+
+# How often the write-ahead log is folded back into the database file
+COMPACT_INTERVAL = 6 * 3600
+
+
+class Storage:
+  """SQLite database shared by every cog.
+
+  The database runs in WAL mode and is only touched from one dedicated
+  thread, so queries never block the event loop and writes are
+  serialized. Appends only grow the write-ahead log; a background task
+  compacts it into the main file every few hours. Cogs use the typed
+  repositories instead of raw SQL.
+  """
+
+  def __init__(self, path: str = DB_PATH):
+    self.path = path
+    self.executor = ThreadPoolExecutor(max_workers=1,
+                                       thread_name_prefix="storage")
+    self.connection: Optional[sqlite3.Connection] = None
+    self.open_lock = asyncio.Lock()
+    self.compact_task: Optional[asyncio.Task] = None
+    self.players = PlayerRepository(self)
+    self.gathering = GatheringRepository(self)
+    self.pin_jobs = PinJobRepository(self)
+    self.translation_jobs = TranslationJobRepository(self)
+
+  async def run(self, func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(self.executor, func, *args)
+
+  async def open(self):
+    async with self.open_lock:
+      if self.connection is None:
+        await self.run(self._open)
+        self.compact_task = asyncio.create_task(self._compact_periodically())
+
+  def _open(self):
+    connection = sqlite3.connect(self.path, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA foreign_keys=ON")
+    connection.create_function("rate_bucket", 1, rate_bucket,
+                               deterministic=True)
+    self.migrate(connection)
+    self.connection = connection
+
+  def migrate(self, connection: sqlite3.Connection):
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:],
+                                       start=version + 1):
+      connection.execute("BEGIN IMMEDIATE")
+      try:
+        if callable(migration):
+          migration(connection)
+        else:
+          for statement in migration.split(";"):
+            if statement.strip():
+              connection.execute(statement)
+        connection.execute(f"PRAGMA user_version = {number}")
+        connection.execute("COMMIT")
+      except Exception:
+        connection.execute("ROLLBACK")
+        raise
+      print(f"Storage migrated to schema version {number}")
+
+  def query(self, sql: str, params=()) -> List[sqlite3.Row]:
+    return self.connection.execute(sql, params).fetchall()
+
+  def transaction(self, statements):
+    """Run (sql, params) pairs atomically; returns the last cursor."""
+    cursor = None
+    self.connection.execute("BEGIN IMMEDIATE")
+    try:
+      for sql, params in statements:
+        cursor = self.connection.execute(sql, params)
+      self.connection.execute("COMMIT")
+    except Exception:
+      self.connection.execute("ROLLBACK")
+      raise
+    return cursor
+
+  async def fetch(self, sql: str, params=()) -> List[sqlite3.Row]:
+    return await self.run(self.query, sql, params)
+
+  async def execute(self, *statements):
+    return await self.run(self.transaction, statements)
+
+  def compact(self):
+    self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    self.connection.execute("PRAGMA optimize")
+
+  async def _compact_periodically(self):
+    while True:
+      await asyncio.sleep(COMPACT_INTERVAL)
+      try:
+        await self.run(self.compact)
+      except sqlite3.Error as e:
+        print(f"Storage compaction failed: {e}")
+
+  async def close(self):
+    if self.compact_task is not None:
+      self.compact_task.cancel()
+    if self.connection is not None:
+      await self.run(self.connection.close)
+      self.connection = None
+
+
+class PlayerRepository:
+
+  def __init__(self, storage: Storage):
+    self.storage = storage
+
+  async def list(self, guild_id: int) -> List[Player]:
+    rows = await self.storage.fetch(
+        "SELECT name, might FROM players WHERE guild_id = ? "
+        "ORDER BY might DESC", (guild_id, ))
+    return [Player(name=row['name'], might=row['might']) for row in rows]
+
+  async def upsert(self, guild_id: int, name: str, might: int):
+    await self.storage.execute(
+        ("INSERT INTO players (guild_id, name, might) VALUES (?, ?, ?) "
+         "ON CONFLICT (guild_id, name) DO UPDATE SET might = excluded.might",
+         (guild_id, name, might)))
+
+  async def update_might(self, guild_id: int, name: str, might: int) -> bool:
+    cursor = await self.storage.execute(
+        ("UPDATE players SET might = ? WHERE guild_id = ? AND name = ?",
+         (might, guild_id, name)))
+    return cursor.rowcount > 0
+
+  async def remove(self, guild_id: int, name: str) -> bool:
+    cursor = await self.storage.execute(
+        ("DELETE FROM players WHERE guild_id = ? AND name = ?",
+         (guild_id, name)))
+    return cursor.rowcount > 0
+
+  async def replace_all(self, guild_id: int, players: List[Player]):
+    await self.storage.execute(
+        ("DELETE FROM players WHERE guild_id = ?", (guild_id, )),
+        *(("INSERT OR REPLACE INTO players (guild_id, name, might) "
+           "VALUES (?, ?, ?)", (guild_id, player['name'], player['might']))
+          for player in players))
+
+  async def apply_changes(self, upserts, deletes):
+    """Write (guild_id, name, Player) upserts and (guild_id, name) deletes."""
+    await self.storage.execute(
+        *(("DELETE FROM players WHERE guild_id = ? AND name = ?",
+           (guild_id, name)) for guild_id, name in deletes),
+        *(("INSERT INTO players (guild_id, name, might) VALUES (?, ?, ?) "
+           "ON CONFLICT (guild_id, name) DO UPDATE SET might = excluded.might",
+           (guild_id, name, player['might']))
+          for guild_id, name, player in upserts))
+
+
+class GatheringRepository:
+
+  def __init__(self, storage: Storage):
+    self.storage = storage
+
+  async def append(self, guild_id: int, record: GatheringRecord):
+    await self.storage.execute(
+        ("INSERT INTO gathering_history (guild_id, date_run, resource_type, "
+         "occupants, gathering_rate, ran_by) VALUES (?, ?, ?, ?, ?, ?)",
+         (guild_id, record['date_run'], record['resource_type'],
+          record['occupants'], record['gathering_rate'], record['ran_by'])),
+        ("INSERT INTO gathering_stats (guild_id, resource_type, runs, "
+         "rate_sum, latest_date, latest_rate, latest_by) "
+         "VALUES (?, ?, 1, ?, ?, ?, ?) "
+         "ON CONFLICT (guild_id, resource_type) DO UPDATE SET "
+         "runs = runs + 1, rate_sum = rate_sum + excluded.rate_sum, "
+         "latest_rate = CASE WHEN excluded.latest_date >= latest_date "
+         "THEN excluded.latest_rate ELSE latest_rate END, "
+         "latest_by = CASE WHEN excluded.latest_date >= latest_date "
+         "THEN excluded.latest_by ELSE latest_by END, "
+         "latest_date = max(latest_date, excluded.latest_date)",
+         (guild_id, record['resource_type'], record['gathering_rate'],
+          record['date_run'], record['gathering_rate'], record['ran_by'])),
+        *self._count_rate(guild_id, record['resource_type'],
+                          record['gathering_rate']))
+
+  @staticmethod
+  def _count_rate(guild_id: int, resource_type: str, rate: float):
+    bucket = rate_bucket(rate)
+    return (
+        ("INSERT INTO gathering_rate_counts (guild_id, resource_type, "
+         "bucket, gathering_rate, runs) VALUES (?, ?, ?, ?, 1) "
+         "ON CONFLICT (guild_id, resource_type, bucket, gathering_rate) "
+         "DO UPDATE SET runs = runs + 1",
+         (guild_id, resource_type, bucket, rate)),
+        ("INSERT INTO gathering_rate_buckets (guild_id, resource_type, "
+         "bucket, runs) VALUES (?, ?, ?, 1) "
+         "ON CONFLICT (guild_id, resource_type, bucket) "
+         "DO UPDATE SET runs = runs + 1",
+         (guild_id, resource_type, bucket)),
+    )
+
+  def _percentile(self, guild_id: int, resource_type: str, runs: int,
+                  fraction: float) -> float:
+    """Nearest rank percentile from the rate histogram.
+
+    Reads every bucket count and then the distinct rates of one bucket,
+    so the cost grows with the spread of the rates, not with the runs.
+    """
+    rank = max(1, math.ceil(fraction * runs))
+    buckets = self.storage.query(
+        "SELECT bucket, runs FROM gathering_rate_buckets "
+        "WHERE guild_id = ? AND resource_type = ? ORDER BY bucket",
+        (guild_id, resource_type))
+    for bucket, bucket_runs in buckets:
+      if rank > bucket_runs:
+        rank -= bucket_runs
+        continue
+      rates = self.storage.query(
+          "SELECT gathering_rate, runs FROM gathering_rate_counts "
+          "WHERE guild_id = ? AND resource_type = ? AND bucket = ? "
+          "ORDER BY gathering_rate", (guild_id, resource_type, bucket))
+      for rate, rate_runs in rates:
+        if rank <= rate_runs:
+          return rate
+        rank -= rate_runs
+    return 0.0  # only if the counts fell out of step with the history
+
+  def _stats(self, guild_id: int) -> List[GatheringStats]:
+    rows = self.storage.query(
+        "SELECT * FROM gathering_stats WHERE guild_id = ? "
+        "ORDER BY resource_type", (guild_id, ))
+    return [
+        GatheringStats(
+            resource_type=row['resource_type'],
+            runs=row['runs'],
+            mean_rate=row['rate_sum'] / row['runs'],
+            median_rate=self._percentile(guild_id, row['resource_type'],
+                                         row['runs'], 0.5),
+            p90_rate=self._percentile(guild_id, row['resource_type'],
+                                      row['runs'], 0.9),
+            latest_date=row['latest_date'],
+            latest_rate=row['latest_rate'],
+            latest_by=row['latest_by']) for row in rows
+    ]
+
+  async def stats(self, guild_id: int) -> List[GatheringStats]:
+    """Per resource type summary of a guild's whole history."""
+    return await self.storage.run(self._stats, guild_id)
+
+  async def list(self, guild_id: int) -> List[GatheringRecord]:
+    rows = await self.storage.fetch(
+        "SELECT date_run, resource_type, occupants, gathering_rate, ran_by "
+        "FROM gathering_history WHERE guild_id = ? ORDER BY id", (guild_id, ))
+    return [GatheringRecord(**row) for row in map(dict, rows)]
+
+  @staticmethod
+  def _window_filter(guild_id, resource_type, since, until):
+    clauses = ["guild_id = ?"]
+    params = [guild_id]
+    if resource_type is not None:
+      clauses.append("resource_type = ?")
+      params.append(resource_type)
+    if since is not None:
+      clauses.append("date_run >= ?")
+      params.append(since)
+    if until is not None:
+      clauses.append("date_run < ?")
+      params.append(until)
+    return " AND ".join(clauses), params
+
+  async def window(self,
+                   guild_id: int,
+                   resource_type: Optional[str] = None,
+                   since: Optional[str] = None,
+                   until: Optional[str] = None,
+                   limit: int = 25,
+                   offset: int = 0) -> List[GatheringRecord]:
+    """Newest-first page of history, read through the date indexes.
+
+    `since` and `until` are 'YYYY-MM-DD HH:MM:SS' strings (a date prefix
+    also works) and bound `date_run` as [since, until).
+    """
+    where, params = self._window_filter(guild_id, resource_type, since, until)
+    rows = await self.storage.fetch(
+        "SELECT date_run, resource_type, occupants, gathering_rate, ran_by "
+        f"FROM gathering_history WHERE {where} "
+        "ORDER BY date_run DESC, id DESC LIMIT ? OFFSET ?",
+        (*params, limit, offset))
+    return [GatheringRecord(**row) for row in map(dict, rows)]
+
+  async def stream(self,
+                   guild_id: int,
+                   resource_type: Optional[str] = None,
+                   since: Optional[str] = None,
+                   until: Optional[str] = None,
+                   chunk_size: int = 500) -> AsyncIterator[List[GatheringRecord]]:
+    """Oldest-first history in chunks, for exports of any size.
+
+    Each chunk is its own short query that resumes after the last row of
+    the previous one, so no cursor stays open between chunks and other
+    queries keep running meanwhile.
+    """
+    where, params = self._window_filter(guild_id, resource_type, since, until)
+    last = ("", 0)
+    while True:
+      rows = await self.storage.fetch(
+          "SELECT id, date_run, resource_type, occupants, gathering_rate, "
+          f"ran_by FROM gathering_history WHERE {where} "
+          "AND (date_run, id) > (?, ?) ORDER BY date_run, id LIMIT ?",
+          (*params, *last, chunk_size))
+      if not rows:
+        return
+      last = (rows[-1]['date_run'], rows[-1]['id'])
+      yield [
+          GatheringRecord(date_run=row['date_run'],
+                          resource_type=row['resource_type'],
+                          occupants=row['occupants'],
+                          gathering_rate=row['gathering_rate'],
+                          ran_by=row['ran_by']) for row in rows
+      ]
+      if len(rows) < chunk_size:
+        return
+
+  async def count(self,
+                  guild_id: int,
+                  resource_type: Optional[str] = None,
+                  since: Optional[str] = None,
+                  until: Optional[str] = None) -> int:
+    where, params = self._window_filter(guild_id, resource_type, since, until)
+    rows = await self.storage.fetch(
+        f"SELECT COUNT(*) FROM gathering_history WHERE {where}", params)
+    return rows[0][0]
+
+  async def replace_all(self, guild_id: int, records: List[GatheringRecord]):
+    await self.storage.execute(
+        ("DELETE FROM gathering_history WHERE guild_id = ?", (guild_id, )),
+        *(("INSERT INTO gathering_history (guild_id, date_run, "
+           "resource_type, occupants, gathering_rate, ran_by) "
+           "VALUES (?, ?, ?, ?, ?, ?)",
+           (guild_id, record['date_run'], record['resource_type'],
+            record['occupants'], record['gathering_rate'], record['ran_by']))
+          for record in records),
+        ("DELETE FROM gathering_stats WHERE guild_id = ?", (guild_id, )),
+        (REBUILD_GATHERING_STATS.format(where="WHERE guild_id = ?"),
+         (guild_id, )),
+        ("DELETE FROM gathering_rate_counts WHERE guild_id = ?", (guild_id, )),
+        ("DELETE FROM gathering_rate_buckets WHERE guild_id = ?",
+         (guild_id, )),
+        *((statement, (guild_id, )) for statement in
+          REBUILD_GATHERING_RATES.format(where="WHERE guild_id = ?").split(";")))
+
+
+class PinJobRepository:
+
+  def __init__(self, storage: Storage):
+    self.storage = storage
+
+  async def list(self, guild_id: Optional[int] = None) -> List[PinJob]:
+    if guild_id is None:
+      rows = await self.storage.fetch("SELECT * FROM pin_jobs ORDER BY id")
+    else:
+      rows = await self.storage.fetch(
+          "SELECT * FROM pin_jobs WHERE guild_id = ? ORDER BY id",
+          (guild_id, ))
+    return [PinJob(**row) for row in map(dict, rows)]
+
+  async def add(self,
+                guild_id: int,
+                channel_id: int,
+                message_id: int,
+                update_frequency: int,
+                last_update_timestamp: float,
+                content: Optional[str] = None,
+                embeds: Optional[str] = None,
+                attachments: Optional[str] = None) -> PinJob:
+    cursor = await self.storage.execute(
+        ("INSERT INTO pin_jobs (guild_id, channel_id, message_id, "
+         "update_frequency, last_update_timestamp, content, embeds, "
+         "attachments) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+         (guild_id, channel_id, message_id, update_frequency,
+          last_update_timestamp, content, embeds, attachments)))
+    return PinJob(id=cursor.lastrowid,
+                  guild_id=guild_id,
+                  channel_id=channel_id,
+                  message_id=message_id,
+                  update_frequency=update_frequency,
+                  last_update_timestamp=last_update_timestamp,
+                  content=content,
+                  embeds=embeds,
+                  attachments=attachments)
+
+  async def update(self, job: PinJob):
+    await self.apply_changes([(job['guild_id'], job['id'], job)], [])
+
+  async def remove(self, job_id: int):
+    await self.storage.execute(("DELETE FROM pin_jobs WHERE id = ?",
+                                (job_id, )))
+
+  async def apply_changes(self, upserts, deletes):
+    """Write (guild_id, job id, PinJob) upserts and (guild_id, job id) deletes."""
+    await self.storage.execute(
+        *(("DELETE FROM pin_jobs WHERE id = ?", (job_id, ))
+          for _, job_id in deletes),
+        *(("UPDATE pin_jobs SET message_id = ?, update_frequency = ?, "
+           "last_update_timestamp = ?, content = ?, embeds = ?, "
+           "attachments = ? WHERE id = ?",
+           (job['message_id'], job['update_frequency'],
+            job['last_update_timestamp'], job.get('content'),
+            job.get('embeds'), job.get('attachments'), job_id))
+          for _, job_id, job in upserts))
+
+
+class TranslationJobRepository:
+
+  def __init__(self, storage: Storage):
+    self.storage = storage
+
+  async def load_all(self) -> Dict[str, TranslationJob]:
+    """Return jobs in the shape AutoTranslate has always used."""
+    jobs = {}
+    for row in await self.storage.fetch(
+        "SELECT job_id, source_channel, priority FROM translation_jobs"):
+      jobs[row['job_id']] = TranslationJob(source_channel=str(
+          row['source_channel']),
+                                           target_channels=[],
+                                           priority=row['priority'])
+    for row in await self.storage.fetch(
+        "SELECT job_id, target_channel, target_language "
+        "FROM translation_targets ORDER BY rowid"):
+      if row['job_id'] in jobs:
+        jobs[row['job_id']]['target_channels'].append(
+            [str(row['target_channel']), row['target_language']])
+    return jobs
+
+  async def add(self, job_id: str, job_details: TranslationJob):
+    await self.storage.execute(
+        ("INSERT INTO translation_jobs (job_id, source_channel, priority) "
+         "VALUES (?, ?, ?)", (job_id, int(job_details['source_channel']),
+                              job_details.get('priority', 'normal'))),
+        *(("INSERT INTO translation_targets VALUES (?, ?, ?)",
+           (job_id, int(target_channel), target_language))
+          for target_channel, target_language in job_details['target_channels']
+          ))
+
+  async def remove(self, job_id: str):
+    await self.storage.execute(("DELETE FROM translation_jobs WHERE job_id = ?",
+                                (job_id, )))
+
+
+_storage: Optional[Storage] = None
+
+
+async def open_storage() -> Storage:
+  """Return the process-wide storage, opening and migrating it on first use."""
+  global _storage
+  if _storage is None:
+    _storage = Storage()
+  await _storage.open()
+  return _storage
@@ -0,0 +1,149 @@
+import re
+from html import escape, unescape
+from typing import List, Optional, Tuple
+
+# Spans DeepL cannot usefully translate: code, Discord markup and links
+UNTRANSLATABLE = re.compile(
+    r"```.*?```"  # code blocks
+    r"|`[^`\n]+`"  # inline code
+    r"|<a?:\w+:\d+>"  # custom emoji
+    r"|<(?:@[!&]?|#)\d+>"  # user, role and channel mentions
+    r"|</[\w -]+:\d+>"  # slash command mentions
+    r"|<t:-?\d+(?::[tTdDfFR])?>"  # timestamps
+    r"|<?https?://[^\s>]+>?",  # links
+    re.DOTALL)
+PLACEHOLDER = re.compile(r'<x i="(\d+)"\s*(?:/>|></x>)')
+
+WORD = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+# Short function-word lists; enough to recognise a sentence, not to be exact
+STOPWORDS = {
+    "EN": {"the", "and", "is", "are", "you", "to", "of", "it", "that", "we",
+           "what", "this", "for", "have", "with", "not", "be", "in", "i"},
+    "DE": {"der", "die", "das", "und", "ist", "ich", "nicht", "du", "wir",
+           "mit", "zu", "es", "ein", "eine", "auf", "sie", "was", "auch"},
+    "FR": {"le", "la", "les", "et", "est", "je", "tu", "nous", "vous", "pas",
+           "des", "un", "une", "que", "pour", "dans", "avec", "il", "ce"},
+    "ES": {"el", "la", "los", "las", "y", "es", "que", "de", "no", "en",
+           "por", "con", "para", "una", "yo", "tu", "lo", "pero", "muy"},
+    "IT": {"il", "lo", "la", "gli", "e", "è", "che", "di", "non", "un",
+           "una", "per", "con", "sono", "io", "tu", "noi", "ma", "anche"},
+    "PT": {"o", "os", "as", "e", "é", "que", "de", "não", "um", "uma",
+           "para", "com", "eu", "você", "nós", "mas", "muito", "do", "da"},
+    "NL": {"de", "het", "een", "en", "is", "ik", "je", "niet", "wij", "we",
+           "met", "van", "dat", "die", "op", "voor", "maar", "ook", "zijn"},
+    "PL": {"i", "w", "nie", "się", "na", "jest", "to", "że", "z", "do",
+           "jak", "ale", "co", "ja", "ty", "my", "tak", "czy", "jestem"},
+    "ID": {"dan", "yang", "di", "ini", "itu", "tidak", "saya", "kamu",
+           "kita", "ada", "dengan", "untuk", "dari", "ke", "akan", "juga"},
+    "TR": {"ve", "bir", "bu", "ne", "için", "ben", "sen", "biz", "değil",
+           "da", "de", "mi", "çok", "var", "yok", "ama", "gibi", "ile"},
+}
+
+
+class PreparedText:
+
+  def __init__(self, text: str, masked: str, spans: List[str],
+               skip: bool = False, detected_lang: Optional[str] = None):
+    self.text = text
+    self.masked = masked
+    self.spans = spans
+    self.skip = skip
+    self.detected_lang = detected_lang
+
+  def restore(self, translated: str) -> str:
+    restored = PLACEHOLDER.sub(
+        lambda match: "\0" + match.group(1) + "\0", translated)
+    restored = unescape(restored)
+    return re.sub(r"\0(\d+)\0", lambda match: self.spans[int(match.group(1))],
+                  restored)
+
+
+def detect_language(text: str) -> Optional[str]:
+  """Guess the language of `text` locally, or None when unsure."""
+  letters = [c for c in text if c.isalpha()]
+  if not letters:
+    return None
+
+  def share(low, high):
+    return sum(low <= c <= high for c in letters) / len(letters)
+
+  if share("぀", "ヿ") > 0.2:
+    return "JA"
+  if share("가", "힯") > 0.5:
+    return "KO"
+  if share("一", "鿿") > 0.5:
+    return "ZH"
+  if share("Ͱ", "Ͽ") > 0.5:
+    return "EL"
+  if share("؀", "ۿ") > 0.5:
+    return "AR"
+  if share("Ѐ", "ӿ") > 0.5:
+    lowered = text.lower()
+    if any(c in lowered for c in "іїєґ"):
+      return "UK"
+    if any(c in lowered for c in "ыэ"):
+      return "RU"
+    return None
+
+  words = [word.lower() for word in WORD.findall(text)]
+  if len(words) < 3:
+    return None
+  scores = sorted(((sum(word in stopwords for word in words), lang)
+                   for lang, stopwords in STOPWORDS.items()),
+                  reverse=True)
+  (best, lang), (runner_up, _) = scores[0], scores[1]
+  if best >= 2 and best >= 2 * runner_up and best / len(words) >= 0.2:
+    return lang
+  return None
+
+
+SENTENCE_BREAK = re.compile(r"(?<=[.!?。！？])\s+|\s*\n\s*")
+
+
+def split_sentences(text: str) -> List[Tuple[str, str]]:
+  """Split text into (sentence, following separator) pairs.
+
+  Joining every sentence and separator gives back the original text.
+  Separators inside untranslatable spans such as code blocks are ignored.
+  """
+  protected = [match.span() for match in UNTRANSLATABLE.finditer(text)]
+  pairs = []
+  position = 0
+  for match in SENTENCE_BREAK.finditer(text):
+    if match.start() == 0 or any(start <= match.start() < end
+                                 for start, end in protected):
+      continue
+    pairs.append((text[position:match.start()], match.group(0)))
+    position = match.end()
+  pairs.append((text[position:], ""))
+  return pairs
+
+
+def prepare_text(text: str, target_lang: str) -> PreparedText:
+  """Mask untranslatable spans and decide whether translation is needed.
+
+  Masked spans become `<x i="N"/>` tags and everything else is
+  XML-escaped, so the text must be sent with XML tag handling. `skip` is set when
+  nothing translatable is left or the text already reads as the target
+  language.
+  """
+  spans = []
+  pieces = []
+  position = 0
+  for match in UNTRANSLATABLE.finditer(text):
+    pieces.append(escape(text[position:match.start()], quote=False))
+    pieces.append(f'<x i="{len(spans)}"/>')
+    spans.append(match.group(0))
+    position = match.end()
+  pieces.append(escape(text[position:], quote=False))
+  masked = "".join(pieces)
+
+  remainder = UNTRANSLATABLE.sub(" ", text)
+  if not any(c.isalpha() for c in remainder):
+    return PreparedText(text, masked, spans, skip=True)
+  detected_lang = detect_language(remainder)
+  if detected_lang and detected_lang == target_lang.split("-")[0].upper():
+    return PreparedText(text, masked, spans, skip=True,
+                        detected_lang=detected_lang)
+  return PreparedText(text, masked, spans)
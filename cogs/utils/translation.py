@@ -0,0 +1,218 @@
+import asyncio
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import deepl
+
+from cogs.utils.quota import QuotaGovernor
+from cogs.utils.text_normalizer import prepare_text, split_sentences
+from cogs.utils.translation_cache import TranslationCache
+
+# DeepL accepts at most this many texts in one request
+MAX_TEXTS_PER_REQUEST = 50
+# Sentences of a whole message are sent wrapped in these tags, so DeepL
+# translates them in context and the result can still be cut per sentence
+SENTENCE_TAG = re.compile(r"<s>(.*?)</s>", re.DOTALL)
+
+
+class TranslationResult:
+
+  def __init__(self, text: str, detected_source_lang: Optional[str],
+               skipped: bool = False):
+    self.text = text
+    self.detected_source_lang = detected_source_lang
+    # True when the text was returned as-is without calling DeepL
+    self.skipped = skipped
+
+
+class TranslationService:
+  """Shared DeepL client for every translation cog.
+
+  The deepl library is synchronous, so each call runs on a small dedicated
+  thread pool instead of the event loop. All calls go through one
+  `deepl.Translator`, which keeps a single pooled HTTPS session to DeepL.
+  Mentions, emoji, links and code are masked before translation, text
+  with nothing left to translate never reaches DeepL, plain translations
+  are served from a `TranslationCache` when possible, and every character
+  actually sent is counted by the `QuotaGovernor`.
+  """
+
+  def __init__(self, auth_key: str, server_url: Optional[str] = None,
+               max_workers: int = 4,
+               cache: Optional[TranslationCache] = None,
+               quota: Optional[QuotaGovernor] = None):
+    self.translator = deepl.Translator(auth_key, server_url=server_url)
+    self.cache = cache if cache is not None else TranslationCache()
+    self.quota = quota if quota is not None else QuotaGovernor()
+    self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                       thread_name_prefix="deepl")
+
+  async def _run(self, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(self.executor,
+                                      lambda: func(*args, **kwargs))
+
+  async def translate_text(self,
+                           text: str,
+                           target_lang: str,
+                           guild_id: Optional[int] = None,
+                           bridge_id: Optional[str] = None,
+                           **kwargs) -> TranslationResult:
+    if not kwargs:
+      results = await self.translate_texts([text], target_lang, guild_id,
+                                           bridge_id)
+      return results[0]
+
+    # Calls with extra DeepL options bypass the normalizer and the cache,
+    # since the options change the output
+    result = await self._run(self.translator.translate_text,
+                             text,
+                             target_lang=target_lang,
+                             **kwargs)
+    self.quota.record(len(text), guild_id, bridge_id)
+    return TranslationResult(result.text, result.detected_source_lang)
+
+  async def translate_texts(self,
+                            texts: List[str],
+                            target_lang: str,
+                            guild_id: Optional[int] = None,
+                            bridge_id: Optional[str] = None
+                            ) -> List[TranslationResult]:
+    """Translate several texts with as few DeepL requests as possible.
+
+    Texts that need no translation or are already cached are answered
+    locally; the rest are sent together, `MAX_TEXTS_PER_REQUEST` per call.
+    """
+    results: List[Optional[TranslationResult]] = [None] * len(texts)
+    pending = []
+    for index, text in enumerate(texts):
+      prepared = prepare_text(text, target_lang)
+      if prepared.skip:
+        results[index] = TranslationResult(text,
+                                           prepared.detected_lang,
+                                           skipped=True)
+        continue
+      cached = await self.cache.get(prepared.masked, target_lang)
+      if cached is not None:
+        results[index] = TranslationResult(prepared.restore(cached[0]),
+                                           cached[1])
+        continue
+      pending.append((index, prepared))
+
+    for start in range(0, len(pending), MAX_TEXTS_PER_REQUEST):
+      batch = pending[start:start + MAX_TEXTS_PER_REQUEST]
+      translated = await self._run(
+          self.translator.translate_text,
+          [prepared.masked for _, prepared in batch],
+          target_lang=target_lang,
+          tag_handling="xml")
+      self.quota.record(sum(len(prepared.masked) for _, prepared in batch),
+                        guild_id, bridge_id)
+      for (index, prepared), result in zip(batch, translated, strict=True):
+        await self.cache.put(prepared.masked, target_lang, result.text,
+                             result.detected_source_lang)
+        results[index] = TranslationResult(prepared.restore(result.text),
+                                           result.detected_source_lang)
+    return results
+
+  async def translate_message(self,
+                              text: str,
+                              target_lang: str,
+                              guild_id: Optional[int] = None,
+                              bridge_id: Optional[str] = None
+                              ) -> TranslationResult:
+    """Translate a whole message and cache each of its sentences.
+
+    All sentences go out as one text, so each is translated with its
+    neighbours as context, but each comes back in its own tag and is
+    cached on its own. A later `translate_sentences` of an edited copy
+    then only pays for the sentences that changed.
+    """
+    pairs = split_sentences(text)
+    if len(pairs) < 2:
+      return await self.translate_text(text, target_lang, guild_id, bridge_id)
+    prepared = [prepare_text(sentence, target_lang) for sentence, _ in pairs]
+    if all(sentence.skip for sentence in prepared):
+      return TranslationResult(text, prepared[0].detected_lang, skipped=True)
+    combined = "".join(f"<s>{sentence.masked}</s>{separator}"
+                       for sentence, (_, separator) in zip(
+                           prepared, pairs, strict=True))
+    # Repeats of the whole message are served from the cache as well
+    cached = await self.cache.get(combined, target_lang)
+    if cached is None:
+      result = await self._run(self.translator.translate_text,
+                               combined,
+                               target_lang=target_lang,
+                               tag_handling="xml",
+                               splitting_tags=["s"])
+      self.quota.record(len(combined), guild_id, bridge_id)
+      cached = (result.text, result.detected_source_lang)
+      await self.cache.put(combined, target_lang, *cached)
+    translated_text, detected = cached
+    translated = SENTENCE_TAG.findall(translated_text)
+    if len(translated) != len(prepared):
+      # DeepL merged or dropped a tag; the sentences cannot be told apart
+      print("Sentence tags lost in translation, translating per sentence")
+      return await self.translate_sentences(text, target_lang, guild_id,
+                                            bridge_id)
+
+    pieces = []
+    for sentence, sentence_text, (_, separator) in zip(prepared, translated,
+                                                       pairs, strict=True):
+      if sentence.skip:
+        pieces.append(sentence.text + separator)
+        continue
+      await self.cache.put(sentence.masked, target_lang, sentence_text,
+                           detected)
+      pieces.append(sentence.restore(sentence_text) + separator)
+    return TranslationResult("".join(pieces), detected)
+
+  async def translate_sentences(self,
+                                text: str,
+                                target_lang: str,
+                                guild_id: Optional[int] = None,
+                                bridge_id: Optional[str] = None
+                                ) -> TranslationResult:
+    """Translate text sentence by sentence so each sentence is cached.
+
+    Meant for re-translating edited messages: sentences already cached by
+    `translate_message` cost nothing, so only the changed ones are sent.
+    """
+    pairs = split_sentences(text)
+    results = await self.translate_texts([sentence for sentence, _ in pairs],
+                                         target_lang, guild_id, bridge_id)
+    translated = "".join(
+        result.text + separator
+        for result, (_, separator) in zip(results, pairs, strict=True))
+    detected = next((result.detected_source_lang for result in results
+                     if result.detected_source_lang), None)
+    return TranslationResult(translated, detected,
+                             skipped=all(result.skipped for result in results))
+
+  async def get_usage(self) -> deepl.Usage:
+    usage = await self._run(self.translator.get_usage)
+    await self.quota.apply_usage(usage)
+    return usage
+
+  def close(self):
+    self.quota.save()
+    self.executor.shutdown(wait=False)
+    self.cache.close()
+
+
+_service: Optional[TranslationService] = None
+
+
+def get_translation_service() -> TranslationService:
+  """Return the process-wide translation service, creating it on first use."""
+  global _service
+  if _service is None:
+    deepl_key = os.getenv("DEEPLKEY")
+    if deepl_key is None:
+      raise ValueError("DEEPLKEY environment variable is not set")
+    # DEEPL_SERVER_URL lets the bot talk to a local DeepL stand-in
+    _service = TranslationService(deepl_key,
+                                  server_url=os.getenv("DEEPL_SERVER_URL"))
+  return _service
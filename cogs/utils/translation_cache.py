@@ -0,0 +1,145 @@
+import asyncio
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+CACHE_DB_PATH = 'cogs/cogfiles/TranslationCache.sqlite3'
+
+
+def normalize_text(text: str) -> str:
+  """Collapse whitespace so trivially different copies share a cache entry."""
+  return " ".join(text.split())
+
+
+class TranslationCache:
+  """Two-tier cache of translations keyed by (normalized text, language).
+
+  The first tier is a size-bounded LRU in memory. The second tier is a
+  SQLite file that survives restarts; it is only touched from a single
+  worker thread so lookups never block the event loop. Entries expire
+  after `ttl` seconds in both tiers.
+  """
+
+  def __init__(self,
+               path: str = CACHE_DB_PATH,
+               memory_size: int = 2048,
+               disk_size: int = 50000,
+               ttl: float = 30 * 24 * 3600):
+    self.path = path
+    self.memory_size = memory_size
+    self.disk_size = disk_size
+    self.ttl = ttl
+    self.memory = OrderedDict()  # key -> (text, detected_lang, expires_at)
+    self.executor = ThreadPoolExecutor(max_workers=1,
+                                       thread_name_prefix="translation-cache")
+    self.connection = None
+    self.writes_since_prune = 0
+    self.memory_hits = 0
+    self.disk_hits = 0
+    self.misses = 0
+
+  def _connect(self):
+    if self.connection is None:
+      self.connection = sqlite3.connect(self.path)
+      self.connection.execute("PRAGMA journal_mode=WAL")
+      self.connection.execute("""
+          CREATE TABLE IF NOT EXISTS translations (
+              source_text TEXT NOT NULL,
+              target_lang TEXT NOT NULL,
+              translated_text TEXT NOT NULL,
+              detected_lang TEXT,
+              expires_at REAL NOT NULL,
+              PRIMARY KEY (source_text, target_lang))""")
+      self.connection.execute(
+          "CREATE INDEX IF NOT EXISTS translations_expiry "
+          "ON translations (expires_at)")
+    return self.connection
+
+  def _disk_get(self, key):
+    row = self._connect().execute(
+        "SELECT translated_text, detected_lang, expires_at FROM translations "
+        "WHERE source_text = ? AND target_lang = ?", key).fetchone()
+    if row is None or row[2] < time.time():
+      return None
+    return row
+
+  def _disk_put(self, key, value):
+    connection = self._connect()
+    with connection:
+      connection.execute(
+          "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?)",
+          key + value)
+      self.writes_since_prune += 1
+      if self.writes_since_prune >= 500:
+        self.writes_since_prune = 0
+        self._prune(connection)
+
+  def _prune(self, connection):
+    connection.execute("DELETE FROM translations WHERE expires_at < ?",
+                       (time.time(), ))
+    # Drop the entries closest to expiry once the file outgrows its budget
+    connection.execute(
+        "DELETE FROM translations WHERE rowid IN ("
+        "SELECT rowid FROM translations ORDER BY expires_at DESC "
+        "LIMIT -1 OFFSET ?)", (self.disk_size, ))
+
+  def _remember(self, key, value):
+    self.memory[key] = value
+    self.memory.move_to_end(key)
+    while len(self.memory) > self.memory_size:
+      self.memory.popitem(last=False)
+
+  async def _run(self, func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(self.executor, func, *args)
+
+  async def get(self, text: str,
+                target_lang: str) -> Optional[Tuple[str, Optional[str]]]:
+    key = (normalize_text(text), target_lang.upper())
+    value = self.memory.get(key)
+    if value is not None:
+      if value[2] >= time.time():
+        self.memory.move_to_end(key)
+        self.memory_hits += 1
+        return value[0], value[1]
+      del self.memory[key]
+
+    try:
+      value = await self._run(self._disk_get, key)
+    except sqlite3.Error as e:
+      print(f"Translation cache lookup failed: {e}")
+      value = None
+    if value is None:
+      self.misses += 1
+      return None
+    self.disk_hits += 1
+    self._remember(key, value)
+    return value[0], value[1]
+
+  async def put(self, text: str, target_lang: str, translated_text: str,
+                detected_lang: Optional[str]):
+    key = (normalize_text(text), target_lang.upper())
+    value = (translated_text, detected_lang, time.time() + self.ttl)
+    self._remember(key, value)
+    try:
+      await self._run(self._disk_put, key, value)
+    except sqlite3.Error as e:
+      print(f"Translation cache write failed: {e}")
+
+  def stats(self) -> dict:
+    lookups = self.memory_hits + self.disk_hits + self.misses
+    return {
+        "memory_hits": self.memory_hits,
+        "disk_hits": self.disk_hits,
+        "misses": self.misses,
+        "hit_rate": (self.memory_hits + self.disk_hits) / lookups
+        if lookups else 0.0,
+        "memory_entries": len(self.memory),
+    }
+
+  def close(self):
+    if self.connection is not None:
+      self.executor.submit(self.connection.close)
+    self.executor.shutdown(wait=True)
@@ -0,0 +1,250 @@
+import asyncio
+from collections import deque
+from typing import Dict, List, Optional, Sequence
+
+import discord
+
+WEBHOOK_NAME = "AutoTranslate"
+MAX_CONTENT_LENGTH = 2000
+MAX_EMBED_DESCRIPTION = 4096
+
+
+def split_text(text: str, limit: int) -> List[str]:
+  """Cut text into pieces of at most `limit` characters.
+
+  Pieces end at the last line break, or failing that the last space,
+  that fits; a run without either is cut at the limit.
+  """
+  pieces = []
+  while len(text) > limit:
+    cut = text.rfind("\n", 0, limit + 1)
+    if cut <= 0:
+      cut = text.rfind(" ", 0, limit + 1)
+    if cut <= 0:
+      cut = limit
+    pieces.append(text[:cut])
+    text = text[cut:].lstrip("\n ")
+  if text or not pieces:
+    pieces.append(text)
+  return pieces
+
+
+class DeliveryItem:
+
+  def __init__(self,
+               author_name: str,
+               avatar_url: Optional[str],
+               text: str,
+               language: str,
+               source_id: Optional[int] = None,
+               source_digest: Optional[str] = None):
+    self.author_name = author_name
+    self.avatar_url = avatar_url
+    self.text = text
+    self.language = language
+    self.source_id = source_id
+    # Identifies the source text, so edits that keep it can be ignored
+    self.source_digest = source_digest
+    # Resolves to the id of the message the item was posted in (or None)
+    self.posted = asyncio.get_running_loop().create_future()
+
+
+class WebhookDelivery:
+  """Per-channel delivery queues for translated messages.
+
+  Each target channel gets one worker that posts through a cached channel
+  webhook under the original author's name and avatar. When a burst backs
+  the queue up, the worker merges the waiting items into a single post
+  instead of sending them one at a time behind the rate limit. A post too
+  long for one message continues in further messages; their ids are
+  reported with the post so edits and deletes can reach them.
+  """
+
+  def __init__(self, client: discord.Client, max_batch: int = 10):
+    self.client = client
+    self.max_batch = max_batch
+    self.queues: Dict[int, deque] = {}
+    self.wakeups: Dict[int, asyncio.Event] = {}
+    self.workers: Dict[int, asyncio.Task] = {}
+    self.webhooks: Dict[int, discord.Webhook] = {}
+    # Channels where we lack Manage Webhooks and fall back to plain sends
+    self.no_webhook_channels = set()
+    # Called as on_posted(channel, message_id, via_webhook, batch,
+    #                     continuation_ids)
+    self.on_posted = None
+
+  def enqueue(self, channel: discord.TextChannel,
+              item: DeliveryItem) -> DeliveryItem:
+    queue = self.queues.get(channel.id)
+    if queue is None:
+      queue = self.queues[channel.id] = deque()
+      wakeup = self.wakeups[channel.id] = asyncio.Event()
+      self.workers[channel.id] = asyncio.create_task(
+          self._worker(channel, queue, wakeup))
+    queue.append(item)
+    self.wakeups[channel.id].set()
+    return item
+
+  async def _worker(self, channel, queue: deque, wakeup: asyncio.Event):
+    while True:
+      if not queue:
+        wakeup.clear()
+        await wakeup.wait()
+        continue
+      batch = [queue.popleft()]
+      length = len(batch[0].text)
+      # Coalesce whatever piled up while the previous post was in flight
+      while queue and len(batch) < self.max_batch:
+        length += len(queue[0].text) + len(queue[0].author_name) + 8
+        if length > MAX_CONTENT_LENGTH:
+          break
+        batch.append(queue.popleft())
+
+      message_id = None
+      try:
+        message_ids, via_webhook = await self._post(channel, batch)
+        message_id = message_ids[0]
+      except Exception as e:
+        print(f"Failed to deliver translation to {channel.id}: {e}")
+      # Guarded on its own: the post is out, whatever the callback does
+      if message_id is not None and self.on_posted is not None:
+        try:
+          self.on_posted(channel, message_id, via_webhook, batch,
+                         message_ids[1:])
+        except Exception as e:
+          print(f"Failed to record translated post {message_id}: {e}")
+      for item in batch:
+        if not item.posted.done():
+          item.posted.set_result(message_id)
+
+  def render(self, batch: List[DeliveryItem]):
+    """Return (username, avatar_url, content) for a batch of items."""
+    first = batch[0]
+    if all(item.author_name == first.author_name for item in batch):
+      return (f"{first.author_name} [{first.language}]"[:80],
+              first.avatar_url, "\n".join(item.text for item in batch))
+    content = "\n".join(f"**{item.author_name}**: {item.text}"
+                        for item in batch)
+    return f"Translated chat [{first.language}]", None, content
+
+  def chunks(self, batch: List[DeliveryItem], via_webhook: bool) -> List[str]:
+    _, _, content = self.render(batch)
+    return split_text(
+        content, MAX_CONTENT_LENGTH if via_webhook else MAX_EMBED_DESCRIPTION)
+
+  async def _post(self, channel, batch: List[DeliveryItem]):
+    """Post a batch; returns (message ids, posted through the webhook)."""
+    username, avatar_url, _ = self.render(batch)
+    message_ids = []
+    for _ in range(2):
+      webhook = await self._get_webhook(channel)
+      if webhook is None:
+        break
+      try:
+        for chunk in self.chunks(batch, via_webhook=True)[len(message_ids):]:
+          message = await webhook.send(
+              content=chunk,
+              username=username,
+              avatar_url=avatar_url,
+              allowed_mentions=discord.AllowedMentions.none(),
+              wait=True)
+          message_ids.append(message.id)
+        return message_ids, True
+      except discord.NotFound:
+        # Webhook was deleted under us; fetch or create a fresh one
+        self.webhooks.pop(channel.id, None)
+      except discord.HTTPException as e:
+        if message_ids:
+          raise
+        print(f"Webhook post to {channel.id} failed, sending plainly: {e}")
+        break
+
+    if message_ids:
+      # Part of the post went out through the webhook; don't repeat it
+      return message_ids, True
+    for chunk in self.chunks(batch, via_webhook=False):
+      message = await channel.send(embed=self.fallback_embed(batch, chunk))
+      message_ids.append(message.id)
+    return message_ids, False
+
+  def fallback_embed(self, batch: List[DeliveryItem],
+                     description: str) -> discord.Embed:
+    username, _, _ = self.render(batch)
+    embed = discord.Embed(title=username,
+                          description=description,
+                          color=0x3498db)
+    embed.set_footer(text=f"Translated to {batch[0].language}")
+    return embed
+
+  async def edit_post(self, channel, message_id: int, via_webhook: bool,
+                      batch: List[DeliveryItem],
+                      continuation_ids: Sequence[int] = ()) -> List[int]:
+    """Re-render an earlier post from its (updated) items.
+
+    The text is spread over the messages the post already has; the last
+    one is cut short if it no longer fits, and messages left empty are
+    deleted. Returns the continuation ids still in use.
+    """
+    message_ids = [message_id, *continuation_ids]
+    chunks = self.chunks(batch, via_webhook)
+    if len(chunks) > len(message_ids):
+      limit = MAX_CONTENT_LENGTH if via_webhook else MAX_EMBED_DESCRIPTION
+      rest = "\n".join(chunks[len(message_ids) - 1:])
+      chunks = chunks[:len(message_ids) - 1] + [rest[:limit - 1] + "\u2026"]
+    webhook = None
+    if via_webhook:
+      webhook = await self._get_webhook(channel)
+      if webhook is None:
+        return list(continuation_ids)
+    for post_id, chunk in zip(message_ids, chunks, strict=False):
+      if webhook is None:
+        await channel.get_partial_message(post_id).edit(
+            embed=self.fallback_embed(batch, chunk))
+      else:
+        await webhook.edit_message(
+            post_id,
+            content=chunk,
+            allowed_mentions=discord.AllowedMentions.none())
+    for post_id in message_ids[len(chunks):]:
+      await self._delete_message(channel, post_id, webhook)
+    return message_ids[1:len(chunks)]
+
+  async def delete_post(self, channel, message_id: int, via_webhook: bool,
+                        continuation_ids: Sequence[int] = ()):
+    webhook = await self._get_webhook(channel) if via_webhook else None
+    for post_id in (message_id, *continuation_ids):
+      await self._delete_message(channel, post_id, webhook)
+
+  async def _delete_message(self, channel, message_id: int,
+                            webhook: Optional[discord.Webhook]):
+    if webhook is not None:
+      await webhook.delete_message(message_id)
+    else:
+      await channel.get_partial_message(message_id).delete()
+
+  async def _get_webhook(self, channel) -> Optional[discord.Webhook]:
+    if channel.id in self.no_webhook_channels:
+      return None
+    webhook = self.webhooks.get(channel.id)
+    if webhook is not None:
+      return webhook
+    try:
+      for existing in await channel.webhooks():
+        if existing.name == WEBHOOK_NAME and existing.user == self.client.user:
+          webhook = existing
+          break
+      else:
+        webhook = await channel.create_webhook(name=WEBHOOK_NAME)
+    except discord.Forbidden:
+      print(f"Missing Manage Webhooks in {channel.id}, using plain messages")
+      self.no_webhook_channels.add(channel.id)
+      return None
+    self.webhooks[channel.id] = webhook
+    return webhook
+
+  def close(self):
+    for worker in self.workers.values():
+      worker.cancel()
+    self.workers.clear()
+    self.queues.clear()
+    self.wakeups.clear()